@@ -1,12 +1,13 @@
 import streamlit as st
 import duckdb
 from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import io
 import json
 import os
-import re
+import numpy as np
 import pandas as pd
 import google.generativeai as genai
 
@@ -39,51 +40,157 @@ _SPLITS_DATA = [
     {"pins": [4, 6], "name": "Golden Gate / Cincinnati", "category": "Middle Row"},
 ]
 
-_SPLITS_CACHE = None
-
-def _load_splits():
-    """Return dict of (sorted pins tuple) -> split name. Uses embedded _SPLITS_DATA."""
-    global _SPLITS_CACHE
-    if _SPLITS_CACHE is not None:
-        return _SPLITS_CACHE
-    _SPLITS_CACHE = {
-        tuple(sorted(int(p) for p in entry["pins"])): entry["name"]
-        for entry in _SPLITS_DATA
-    }
-    return _SPLITS_CACHE
-
-def _normalize_pins_list(pins_left_list):
-    """Convert to list of ints 1-10; return [] if invalid or headpin (1) present."""
-    if not pins_left_list:
-        return []
-    out = []
-    for p in pins_left_list:
+def _pins_mask(pins):
+    """10-bit mask of a list of pin numbers 1-10 (bit p-1 set for pin p)."""
+    mask = 0
+    for p in pins:
+        mask |= 1 << (p - 1)
+    return mask
+
+# Split name for each of the 1024 possible standing-pin masks (None = not a split).
+# No entry contains the headpin or fewer than two pins, so those rules are built in.
+_SPLIT_NAMES_BY_MASK = {_pins_mask(entry["pins"]): entry["name"] for entry in _SPLITS_DATA}
+_SPLIT_TABLE = tuple(_SPLIT_NAMES_BY_MASK.get(mask) for mask in range(1024))
+
+def _standing_mask(pins_left_list):
+    """Mask of the valid pins (1-10, ints or numeric strings) in pins_left_list; junk entries are skipped."""
+    mask = 0
+    for p in pins_left_list or ():
         try:
-            v = int(p) if not isinstance(p, int) else p
-            if 1 <= v <= 10:
-                out.append(v)
+            v = p if isinstance(p, int) else int(p)
         except (TypeError, ValueError):
             continue
-    return out
+        if 1 <= v <= 10:
+            mask |= 1 << (v - 1)
+    return mask
+
+_ALL_PINS = tuple(range(1, 11))
+_ALL_PINS_MASK = (1 << 10) - 1
+# "1, 2, ..." text (the pins_left / pins_knocked_down column format) for every mask, in pin order
+_PINS_STR_BY_MASK = tuple(", ".join(str(p) for p in _ALL_PINS if mask >> (p - 1) & 1) for mask in range(1024))
+# Pin numbers set in every mask, for the second-ball picker's options
+_PINS_BY_MASK = tuple(tuple(p for p in _ALL_PINS if mask >> (p - 1) & 1) for mask in range(1024))
+# Standing/knocked pin count for every mask
+_POPCOUNT = np.array([mask.bit_count() for mask in range(1024)], dtype=np.int64)
+# Array forms of the text and split tables, indexed by whole mask columns when grid edits are re-derived
+_PINS_STR_ARRAY = np.array(_PINS_STR_BY_MASK, dtype=object)
+_SPLIT_ARRAY = np.array(_SPLIT_TABLE, dtype=object)
+
+# Reverse of _PINS_STR_BY_MASK: every string the app itself writes maps straight to its mask
+_MASK_BY_PINS_STR = {text: mask for mask, text in enumerate(_PINS_STR_BY_MASK)}
+
+def _pins_str_mask(pins_str):
+    """Mask of a stored pins string like "7, 10" ('' / 'N/A' / non-strings -> 0)."""
+    if not isinstance(pins_str, str):
+        return 0
+    mask = _MASK_BY_PINS_STR.get(pins_str)
+    if mask is None:
+        # Hand-typed grid edits or older files ("7,10", "10 7", ...)
+        mask = _standing_mask(p for p in pins_str.replace(',', ' ').split() if p.isdigit())
+    return mask
+
+def _mask_column(df, column):
+    """Integer mask column as an int64 array (NULL -> 0), ready to index _POPCOUNT / _SPLIT_TABLE."""
+    return df[column].fillna(0).to_numpy(dtype=np.int64)
 
 def get_split_name(pins_left_list):
-    """If pins_left (standing) matches a known split in splits.json, return its name; else None."""
-    pins = _normalize_pins_list(pins_left_list)
-    if len(pins) < 2 or 1 in pins:
-        return None
-    key = tuple(sorted(pins))
-    return _load_splits().get(key)
+    """Split name for a list of standing pins (ints or numeric strings), else None.
+    List-based entry point; hot paths that already hold a mask index _SPLIT_TABLE directly."""
+    return _SPLIT_TABLE[_standing_mask(pins_left_list)]
 
 # --- AI Logic ---
-def get_ai_suggestion(api_key, df_set, balls_in_bag, model_name):
+@st.cache_resource(show_spinner=False)
+def _configure_genai(api_key):
+    """genai.configure is process-wide: run it once per key, not again for every model the user switches to."""
+    genai.configure(api_key=api_key)
+
+@st.cache_resource(show_spinner=False)
+def _get_model(api_key, model_name):
+    """Build the model once per (key, model); reused across reruns and sessions."""
+    _configure_genai(api_key)
+    return genai.GenerativeModel(model_name)
+
+def _stream_response(model, prompt, error_prefix, on_complete=None):
+    """Yield response text as it arrives (for st.write_stream); an error ends the stream with a message.
+    If streaming fails before any text arrived, the prompt is retried once as a plain (non-streamed) call.
+    on_complete(text) is called with the full answer only when it finished without error."""
+    parts = []
+    try:
+        for chunk in model.generate_content(prompt, stream=True):
+            parts.append(chunk.text)
+            yield chunk.text
+    except Exception as e:
+        if parts:
+            yield f"{error_prefix}: {e}"
+            return
+        try:
+            text = model.generate_content(prompt).text
+        except Exception as e:
+            yield f"{error_prefix}: {e}"
+            return
+        parts.append(text)
+        yield text
+    if on_complete:
+        on_complete("".join(parts))
+
+# Shot columns the coach needs; ids, set/game ids and timestamps only cost prompt tokens
+_PROMPT_COLUMNS = [
+    'game_number', 'frame_number', 'shot_number', 'shot_result', 'pins_left', 'lane_number',
+    'bowling_ball', 'arrows_pos', 'breakpoint_pos', 'ball_reaction',
+]
+
+def _prompt_table(df, leading=()):
+    """Compact CSV of the prompt columns present in df (much denser than df.to_string())."""
+    cols = [c for c in (*leading, *_PROMPT_COLUMNS) if c in df.columns]
+    return df[cols].to_csv(index=False)
+
+def _ball_summary(df):
+    """Per-ball first-shot stats (shots, strike %, split %, average pins) as CSV for the game-plan prompt."""
+    if 'shot_number' not in df.columns or 'bowling_ball' not in df.columns:
+        return "(not available)"
+    first = df[df['shot_number'] == 1]
+    if first.empty:
+        return "(not available)"
+    stats = first.assign(
+        ball=first['bowling_ball'].fillna('(unknown)'),
+        strike=first['shot_result'].eq('Strike'),
+        split=first['shot_result'].eq('Leave - Split'),
+        pins=10 - _POPCOUNT[[_pins_str_mask(v) for v in first['pins_left']]],
+    ).groupby('ball').agg(
+        shots=('strike', 'size'), strike_pct=('strike', 'mean'), split_pct=('split', 'mean'), avg_pins=('pins', 'mean'),
+    )
+    stats[['strike_pct', 'split_pct']] *= 100
+    return stats.round(1).to_csv()
+
+def _set_summary(df):
+    """Per-set rates (games, strike %, split %, spare %) as CSV, so every selected set reaches the prompt in one line."""
+    if 'set_name' not in df.columns or 'shot_number' not in df.columns:
+        return "(not available)"
+    grouped = df.assign(
+        first=df['shot_number'].eq(1),
+        strike=df['shot_number'].eq(1) & df['shot_result'].eq('Strike'),
+        split=df['shot_number'].eq(1) & df['shot_result'].eq('Leave - Split'),
+        second=df['shot_number'].eq(2),
+        spare=df['shot_number'].eq(2) & df['shot_result'].eq('Spare'),
+    ).groupby('set_name', sort=False)
+    stats = grouped.agg(
+        games=('game_number', 'nunique'), first_balls=('first', 'sum'), strikes=('strike', 'sum'),
+        splits=('split', 'sum'), second_balls=('second', 'sum'), spares=('spare', 'sum'),
+    )
+    stats['strike_pct'] = 100 * stats['strikes'] / stats['first_balls'].where(stats['first_balls'] > 0)
+    stats['split_pct'] = 100 * stats['splits'] / stats['first_balls'].where(stats['first_balls'] > 0)
+    stats['spare_pct'] = 100 * stats['spares'] / stats['second_balls'].where(stats['second_balls'] > 0)
+    return stats[['games', 'first_balls', 'strike_pct', 'split_pct', 'spare_pct']].round(1).to_csv()
+
+def get_ai_suggestion(api_key, df_set, balls_in_bag, model_name, on_complete=None):
     """
     Analyzes game data from a set and provides a suggestion for the next shot.
+    Returns an iterator of text chunks for st.write_stream.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
+        model = _get_model(api_key, model_name)
         df_set = df_set.sort_values(by=['game_number', 'id'])
-        data_summary = df_set.to_string()
+        data_summary = _prompt_table(df_set)
         in_bag_summary = ", ".join(balls_in_bag)
 
         prompt = f"""
@@ -103,19 +210,18 @@ def get_ai_suggestion(api_key, df_set, balls_in_bag, model_name):
         YOUR TASK:
         Based on all the data, what is your single most important suggestion for the next shot? This could be a move on the lane OR a ball change. Explain your reasoning.
         """
-        response = model.generate_content(prompt)
-        return response.text
+        return _stream_response(model, prompt, "An error occurred while getting a suggestion", on_complete)
     except Exception as e:
-        return f"An error occurred while getting a suggestion: {e}"
+        return iter([f"An error occurred while getting a suggestion: {e}"])
 
-def get_ai_analysis(api_key, df_game, model_name):
+def get_ai_analysis(api_key, df_game, model_name, on_complete=None):
     """
     Performs a post-game analysis and provides practice recommendations.
+    Returns an iterator of text chunks for st.write_stream.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        data_summary = df_game.to_string()
+        model = _get_model(api_key, model_name)
+        data_summary = _prompt_table(df_game.sort_values(by=['frame_number', 'shot_number', 'id']))
 
         prompt = f"""
         You are an expert bowling coach. Your task is to analyze a completed bowling game and provide practice recommendations.
@@ -130,20 +236,25 @@ def get_ai_analysis(api_key, df_game, model_name):
 
         Provide a concise, easy-to-read analysis.
         """
-        response = model.generate_content(prompt)
-        return response.text
+        return _stream_response(model, prompt, "An error occurred while getting analysis", on_complete)
     except Exception as e:
-        return f"An error occurred while getting analysis: {e}"
+        return iter([f"An error occurred while getting analysis: {e}"])
 
 def get_ai_historical_game_plan(api_key, df_combined, user_goal, model_name):
     """
     Strategic analysis over multiple sets. Uses same AI config; prompt is goal-driven.
+    Returns an iterator of text chunks for st.write_stream.
     """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
+        model = _get_model(api_key, model_name)
         df_combined = df_combined.sort_values(by=['set_name', 'game_number', 'id'])
-        data_summary = df_combined.to_string()
+        set_summary = _set_summary(df_combined)
+        ball_summary = _ball_summary(df_combined)
+        # Every set is covered by the summaries; shot rows (the bulk of the prompt) only for the newest set.
+        # set ids are "set-<timestamp>", so the largest is the most recent.
+        latest_set = df_combined['set_id'].max() if 'set_id' in df_combined.columns else None
+        df_latest = df_combined[df_combined['set_id'] == latest_set] if latest_set is not None else df_combined
+        data_summary = _prompt_table(df_latest, leading=('set_name', 'bowling_center'))
 
         prompt = f"""
         You are an expert bowling coach. The bowler has selected multiple past sets and is asking for a strategic game plan.
@@ -151,149 +262,210 @@ def get_ai_historical_game_plan(api_key, df_combined, user_goal, model_name):
         Their goal or question:
         {user_goal}
 
-        Combined shot data from the selected sets (all games, all shots):
+        Summary per selected set (percentages of first balls; spare_pct of second balls):
+        {set_summary}
+
+        First-ball summary per bowling ball across the selected sets:
+        {ball_summary}
+
+        Shot-by-shot data from the most recent selected set (all games, CSV):
         {data_summary}
 
         YOUR TASK:
         Provide a clear, actionable game plan. Consider patterns across sets (e.g., ball reaction, lane play, spare issues), and give specific recommendations (ball choice, line, adjustments) for the situation they described. Be concise and strategic.
         """
-        response = model.generate_content(prompt)
-        return response.text
+        return _stream_response(model, prompt, "An error occurred while getting the game plan")
     except Exception as e:
-        return f"An error occurred while getting the game plan: {e}"
+        return iter([f"An error occurred while getting the game plan: {e}"])
 
 
 # --- Database Setup ---
-con = duckdb.connect(database='bowling.db', read_only=False)
-con.execute("CREATE SEQUENCE IF NOT EXISTS seq_shots_id START 1;")
-con.execute("""
-    CREATE TABLE IF NOT EXISTS shots (
-        id INTEGER PRIMARY KEY DEFAULT nextval('seq_shots_id'),
-        set_id VARCHAR,
-        set_name VARCHAR,
-        game_id VARCHAR,
-        game_number INTEGER,
-        frame_number INTEGER,
-        shot_number INTEGER,
-        shot_result VARCHAR,
-        pins_knocked_down VARCHAR,
-        pins_left VARCHAR,
-        lane_number VARCHAR,
-        bowling_ball VARCHAR,
-        arrows_pos INTEGER,
-        breakpoint_pos INTEGER,
-        ball_reaction VARCHAR,
-        shot_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-""")
-con.execute("""
-    CREATE TABLE IF NOT EXISTS arsenal (
-        ball_name VARCHAR PRIMARY KEY
-    );
-""")
-
-# Pre-populate the arsenal if it's empty
-if con.execute("SELECT COUNT(*) FROM arsenal").fetchone()[0] == 0:
-    default_balls = [
-        "Storm Phaze II - Pin Down", "Storm IQ Tour - Pin Down", "Roto Grip Attention Star - Pin Up",
-        "Storm Lightning Blackout - Pin Up", "Storm Absolute - Pin Up", "Brunswick Prism - Pin Up"
-    ]
-    for ball in default_balls:
-        con.execute("INSERT INTO arsenal (ball_name) VALUES (?)", (ball,))
-    con.commit()
-
-try:
-    con.execute("ALTER TABLE shots ADD COLUMN bowling_ball VARCHAR;")
-    con.commit()
-except duckdb.Error:
-    pass
-try:
-    con.execute("ALTER TABLE shots ADD COLUMN bowling_center VARCHAR;")
-    con.commit()
-except duckdb.Error:
-    pass
-try:
-    con.execute("ALTER TABLE shots ADD COLUMN split_name VARCHAR;")
-    con.commit()
-except duckdb.Error:
-    pass
+# Arsenal seed for a new database, as executemany parameter rows
+_DEFAULT_BALLS = [
+    ("Storm Phaze II - Pin Down",), ("Storm IQ Tour - Pin Down",), ("Roto Grip Attention Star - Pin Up",),
+    ("Storm Lightning Blackout - Pin Up",), ("Storm Absolute - Pin Up",), ("Brunswick Prism - Pin Up",),
+]
+def _init_database(db):
+    """Create/migrate the schema, seed the arsenal and build indexes. Called once per database by get_connection."""
+    db.execute("CREATE SEQUENCE IF NOT EXISTS seq_shots_id START 1;")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS shots (
+            id INTEGER PRIMARY KEY DEFAULT nextval('seq_shots_id'),
+            set_id VARCHAR,
+            set_name VARCHAR,
+            game_id VARCHAR,
+            game_number INTEGER,
+            frame_number INTEGER,
+            shot_number INTEGER,
+            shot_result VARCHAR,
+            pins_knocked_down VARCHAR,
+            pins_left VARCHAR,
+            lane_number VARCHAR,
+            bowling_ball VARCHAR,
+            arrows_pos INTEGER,
+            breakpoint_pos INTEGER,
+            ball_reaction VARCHAR,
+            shot_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS arsenal (
+            ball_name VARCHAR PRIMARY KEY
+        );
+    """)
+
+    # Pre-populate the arsenal if it's empty
+    if db.execute("SELECT 1 FROM arsenal LIMIT 1").fetchone() is None:
+        db.executemany("INSERT INTO arsenal (ball_name) VALUES (?)", _DEFAULT_BALLS)
+        db.commit()
+
+    # Columns added after the first release: probe once rather than letting ALTERs fail on every run
+    shots_columns = {row[1] for row in db.execute("PRAGMA table_info('shots')").fetchall()}
+    added_columns = {
+        "bowling_ball": "VARCHAR", "bowling_center": "VARCHAR", "split_name": "VARCHAR",
+        "pins_left_mask": "INTEGER", "pins_knocked_mask": "INTEGER",
+    }
+    missing_columns = [c for c in added_columns if c not in shots_columns]
+    for column in missing_columns:
+        db.execute(f"ALTER TABLE shots ADD COLUMN {column} {added_columns[column]};")
+    if "pins_left_mask" in missing_columns:
+        # Backfill the integer pin masks from the text columns they mirror
+        rows = db.execute("SELECT id, pins_left, pins_knocked_down FROM shots").fetchall()
+        if rows:
+            db.executemany(
+                "UPDATE shots SET pins_left_mask = ?, pins_knocked_mask = ? WHERE id = ?",
+                [(_pins_str_mask(left), _pins_str_mask(knocked), sid) for sid, left, knocked in rows],
+            )
+    if missing_columns:
+        db.commit()
+        # Flush the ALTERs out of the WAL; DuckDB can fail replaying ADD COLUMN on this table after a crash
+        db.execute("CHECKPOINT")
+
+    # Per-set loads, set deletes/renames, game-state restore and the frame lookups filter on these columns
+    db.execute("CREATE INDEX IF NOT EXISTS idx_shots_set ON shots(set_id);")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_shots_game_frame ON shots(game_id, frame_number, shot_number);")
+
+@st.cache_resource(show_spinner=False)
+def get_connection(db_path):
+    """Process-wide DuckDB connection for db_path, opened and set up on first use and reused across reruns."""
+    db = duckdb.connect(database=db_path, read_only=False)
+    _init_database(db)
+    return db
+
+# Sessions run on separate script threads and a DuckDB connection is not thread-safe: each run works on its own cursor
+con = get_connection(os.path.abspath('bowling.db')).cursor()
+
+# Write statements shared by the shot entry and the edit grid
+_INSERT_SHOT_SQL = "INSERT INTO shots (set_id, set_name, game_id, game_number, frame_number, shot_number, shot_result, pins_knocked_down, pins_left, lane_number, bowling_ball, arrows_pos, breakpoint_pos, ball_reaction, bowling_center, split_name, pins_knocked_mask, pins_left_mask) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_DELETE_SET_SQL = "DELETE FROM shots WHERE set_id = ?"
+_RENAME_SET_SQL = "UPDATE shots SET set_name = ? WHERE set_id = ?"
+# Grid edits are applied as one set-based UPDATE from a registered frame with these columns (see _edit_frame)
+_EDIT_COLUMNS = ['shot_result', 'pins_knocked_down', 'pins_left', 'lane_number', 'bowling_ball', 'arrows_pos', 'breakpoint_pos', 'ball_reaction', 'split_name', 'pins_knocked_mask', 'pins_left_mask', 'id']
+# Only rows whose derived values differ are rewritten: the grid resubmits the whole set on every save
+_UPDATE_EDITS_SQL = (
+    "UPDATE shots SET " + ", ".join(f"{c}=e.{c}" for c in _EDIT_COLUMNS[:-1]) + " FROM df_edits e WHERE shots.id = e.id"
+    " AND (" + " OR ".join(f"shots.{c} IS DISTINCT FROM e.{c}" for c in _EDIT_COLUMNS[:-1]) + ")"
+)
+
+# --- Cached Queries ---
+@st.cache_resource(show_spinner=False)
+def _statement(sql):
+    """Parse sql once per process; DuckDB's Python API has no prepare(), but a parsed Statement can be re-executed."""
+    return duckdb.extract_statements(sql)[0]
+
+def _set_version(set_id):
+    """Cheap change probe for a set: newest shot id (0 when empty). Used only as a cache key."""
+    return con.execute(_statement("SELECT COALESCE(MAX(id), 0) FROM shots WHERE set_id = ?"), [set_id]).fetchone()[0]
+
+# A set's shots in game/frame/shot order (id breaks ties), sorted by DuckDB so the grid and Save Edits need no sort_values
+_SET_SHOTS_SQL = "SELECT * FROM shots WHERE set_id = ? ORDER BY game_number, frame_number, shot_number, id"
+
+# Bounded because every submitted shot adds a new version entry instead of clearing the cache
+@st.cache_data(ttl=600, max_entries=8, show_spinner=False)
+def _load_set_df(set_id, version):
+    """All shots for a set (_SET_SHOTS_SQL order). Cached per (set_id, version) so reruns without a write skip the DB scan."""
+    return con.execute(_statement(_SET_SHOTS_SQL), [set_id]).fetchdf()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _load_all_sets():
+    """(set_id, set_name) pairs for the set selector."""
+    return con.execute("SELECT DISTINCT set_id, set_name FROM shots ORDER BY set_name DESC").fetchall()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _load_arsenal():
+    """Ball names in the arsenal, sorted."""
+    return [row[0] for row in con.execute("SELECT ball_name FROM arsenal ORDER BY ball_name").fetchall()]
+
+def _invalidate_shot_caches():
+    """Call after UPDATE/DELETE/bulk loads on shots (edits and renames don't change MAX(id)).
+    A plain shot INSERT doesn't need it: it moves the version the loaders are keyed on."""
+    _load_set_df.clear()
+    _load_all_sets.clear()
+    _cached_game_scores.clear()
+    _cached_score_sheet_html.clear()
+    # Coach answers are keyed on MAX(id), which edits don't move
+    st.session_state.pop('ai_answers', None)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _cached_game_scores(game_id, version, _df_game):
+    """calculate_scores keyed on (game_id, set version) only; hashing the DataFrame would cost more than scoring it."""
+    return calculate_scores(_df_game)
 
 # --- Scoring Logic (per bowl.com / USBC) ---
-def get_pins_from_str(pins_str):
-    if not pins_str or pins_str == "N/A" or (isinstance(pins_str, float) and pd.isna(pins_str)):
-        return []
-    s = str(pins_str).strip()
-    if not s:
-        return []
-    return [int(p.strip()) for p in s.replace(',', ' ').split() if p.strip().isdigit()]
-
-def _ball_scores_from_shots(df, shots_ordered):
-    """Build list of pins knocked down per delivery for scoring."""
-    raw = []
-    for s in shots_ordered:
-        if s['shot_result'] == 'Strike':
-            raw.append(10)
-        elif s['shot_result'] == 'Spare':
-            shot1 = next((x for x in shots_ordered if x['frame_number'] == s['frame_number'] and x['shot_number'] == 1), None)
-            if shot1 is not None:
-                left = get_pins_from_str(shot1.get('pins_left'))
-                raw.append(10 - len(left) if left is not None else 10)
-            else:
-                raw.append(0)
-        else:
-            kn = get_pins_from_str(s.get('pins_knocked_down'))
-            raw.append(len(kn) if kn is not None else 0)
-    return raw
+# Shot result codes for the scoring kernel (anything not listed scores as pins knocked down)
+_RESULT_OPEN, _RESULT_STRIKE, _RESULT_SPARE = 0, 1, 2
+_RESULT_CODES = {'Strike': _RESULT_STRIKE, 'Spare': _RESULT_SPARE}
 
-def calculate_scores(df):
-    """Returns (frame_scores[10], total_score, max_possible). Simple frame-by-frame per USBC."""
-    if df is None or df.empty:
-        return [None] * 10, 0, 300
+def _score_kernel(frames, results, knocked):
+    """Integer-only scoring walk over parallel lists sorted by (frame, shot, id).
+
+    frames: frame number per delivery; results: _RESULT_* code; knocked: pin count for
+    non-strike/spare deliveries. Returns (frame_scores[10], total_score, max_possible).
+    """
+    n = len(frames)
+    # Pins per delivery; a spare takes whatever the previous ball in the frame left
+    balls = [0] * n
+    for j in range(n):
+        if results[j] == _RESULT_STRIKE:
+            balls[j] = 10
+        elif results[j] == _RESULT_SPARE:
+            balls[j] = 10 - balls[j - 1] if j > 0 and frames[j - 1] == frames[j] else 0
+        else:
+            balls[j] = knocked[j]
 
-    shots = df.sort_values(by=['frame_number', 'shot_number', 'id']).to_dict('records')
-    balls = _ball_scores_from_shots(df, shots)
     frame_scores = [None] * 10
     total = 0
     i = 0
-
     for frame in range(10):
         frame_num = frame + 1
-        if i >= len(shots):
-            break
-        cur = shots[i]
-        if cur['frame_number'] != frame_num:
+        if i >= n or frames[i] != frame_num:
             break
 
         if frame_num < 10:
-            if cur['shot_result'] == 'Strike':
+            if results[i] == _RESULT_STRIKE:
                 # 10 + next two balls
-                if i + 2 < len(balls):
-                    total += 10 + balls[i + 1] + balls[i + 2]
-                else:
+                if i + 2 >= n:
                     break
-                frame_scores[frame] = total
+                total += 10 + balls[i + 1] + balls[i + 2]
                 i += 1
             else:
                 # two shots in frame
-                if i + 1 >= len(shots) or shots[i + 1]['frame_number'] != frame_num:
+                if i + 1 >= n or frames[i + 1] != frame_num:
                     break
-                s1, s2 = balls[i], balls[i + 1]
-                if shots[i + 1]['shot_result'] == 'Spare':
-                    if i + 2 < len(balls):
-                        total += 10 + balls[i + 2]
-                    else:
+                if results[i + 1] == _RESULT_SPARE:
+                    if i + 2 >= n:
                         break
+                    total += 10 + balls[i + 2]
                 else:
-                    total += s1 + s2
-                frame_scores[frame] = total
+                    total += balls[i] + balls[i + 1]
                 i += 2
+            frame_scores[frame] = total
         else:
             # Frame 10: sum of all balls in frame (1, 2, or 3)
-            frame_10_indices = [j for j in range(len(shots)) if shots[j]['frame_number'] == 10]
-            frame_10_balls = [balls[j] for j in frame_10_indices]
-            total += sum(frame_10_balls)
+            while i < n and frames[i] == 10:
+                total += balls[i]
+                i += 1
             frame_scores[frame] = total
-            i += len(frame_10_indices)
 
     # Max possible per USBC: spare frame = 10+next ball (max 20); strike = 10+next two (max 30)
     max_score = 0
@@ -302,88 +474,124 @@ def calculate_scores(df):
         max_score = frame_scores[last_done]
     start = last_done + 1  # first unscored frame (1-based frame num = start + 1)
     if start < 10:
-        # Current incomplete frame: no balls -> 30; one ball strike -> 30; one ball leave -> 20; frame 10 with 2 balls -> 20 or 30
-        shots_in_frame = [s for s in shots if s['frame_number'] == start + 1]
-        if not shots_in_frame:
+        # Current incomplete frame: no balls -> 30; first ball strike -> 30; first ball leave -> 20
+        # The walk stopped at this frame's first delivery, so i already points at it
+        first = i if i < n and frames[i] == start + 1 else None
+        if first is None or results[first] == _RESULT_STRIKE:
             max_score += 30
-        elif len(shots_in_frame) == 1:
-            if shots_in_frame[0]['shot_result'] == 'Strike':
-                max_score += 30
-            else:
-                max_score += 20  # leave -> best is spare (10+10)
         else:
-            # frame 10 with 2 balls (waiting for fill): strike first -> 30, else spare -> 20
-            if shots_in_frame[0]['shot_result'] == 'Strike':
-                max_score += 30
-            else:
-                max_score += 20
-        for _ in range(start + 1, 10):
-            max_score += 30
+            max_score += 20  # leave -> best is spare (10+10)
+        max_score += 30 * (9 - start)
     return frame_scores, total, max_score if max_score > 0 else 300
 
-def _shot_display_symbol(shot, is_first_shot):
-    """Symbol for score sheet: X, /, -, S (split), or count. shot is a dict with shot_result, pins_left, pins_knocked_down."""
-    shot_result = shot.get('shot_result') or ''
-    pins_left_str = shot.get('pins_left')
-    pins = get_pins_from_str(pins_left_str) if pins_left_str else []
+def calculate_scores(df):
+    """Returns (frame_scores[10], total_score, max_possible). Simple frame-by-frame per USBC."""
+    if df is None or df.empty:
+        return [None] * 10, 0, 300
+
+    # Order the three input columns by one lexsort of the key arrays (NULLs last, as sort_values did)
+    # instead of sorting a copy of the whole frame
+    frame_key = df['frame_number'].to_numpy(dtype=float, na_value=np.nan)
+    order = np.lexsort((
+        df['id'].to_numpy(dtype=float, na_value=np.nan),
+        df['shot_number'].to_numpy(dtype=float, na_value=np.nan),
+        frame_key,
+    ))
+    frames = np.nan_to_num(frame_key[order]).astype(np.int64).tolist()
+    # Plain dict lookups: Series.map(dict) costs more than the rest of the scoring put together
+    results = np.fromiter((_RESULT_CODES.get(r, _RESULT_OPEN) for r in df['shot_result']), dtype=np.int64, count=len(df))[order].tolist()
+    knocked = _POPCOUNT[_mask_column(df, 'pins_knocked_mask')][order].tolist()
+    return _score_kernel(frames, results, knocked)
+
+def _first_ball_symbol(left_mask):
+    """Score-sheet symbol for a first-ball Leave: S<count> for a split, the count, or - when nothing fell."""
+    left = left_mask.bit_count()
+    if _SPLIT_TABLE[left_mask]:
+        return 'S' + str(10 - left)  # e.g. S8 for 7,10 split
+    return str(10 - left) if left else '-'
+
+# First-ball Leave symbol for every standing-pin mask, so the score sheet never builds one per cell
+_FIRST_BALL_SYMBOL_BY_MASK = tuple(_first_ball_symbol(mask) for mask in range(1024))
+
+def _shot_display_symbol(shot_result, left_mask, knocked_count, is_first_shot):
+    """Symbol for score sheet: X, /, -, S (split), or count. left_mask is the delivery's pins_left_mask (a Python int)."""
     if shot_result == 'Strike':
         return 'X'
     if shot_result == 'Spare':
         return '/'
     if shot_result in ('Leave', 'Leave - Split') and is_first_shot:
-        if get_split_name(pins):
-            return 'S' + str(10 - len(pins))  # e.g. S8 for 7,10 split
-        return str(10 - len(pins)) if pins else '-'
+        return _FIRST_BALL_SYMBOL_BY_MASK[left_mask]
     if shot_result == 'Open':
-        kn = get_pins_from_str(shot.get('pins_knocked_down'))
-        return str(len(kn)) if kn else '-'
+        return str(knocked_count) if knocked_count else '-'
     return '-'
 
 def _html_esc(s):
     return str(s).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-def render_score_sheet(df_game, frame_scores, total_score, max_score):
+# Score sheet styling, sent once per render instead of repeated inline on all 26 cells
+_SCORE_SHEET_CSS = (
+    "<style>"
+    "table.scoresheet{border-collapse:collapse;margin:8px 0;}"
+    "table.scoresheet th,table.scoresheet td{border:1px solid #ccc;padding:6px 8px;}"
+    "table.scoresheet th{color:#1a1a1a;background:#e0e0e0;}"
+    "table.scoresheet td{text-align:center;}"
+    "table.scoresheet td.total{font-weight:bold;}"
+    "</style>"
+)
+
+_SCORE_SHEET_HEADER = "".join(f"<th>{f}</th>" for f in range(1, 11)) + "<th>Total</th><th>Max</th>"
+
+def _score_sheet_html(df_game, frame_scores, total_score, max_score):
     """Score sheet as a formatted HTML table: 10 frames with symbols, running total, max at end."""
     if df_game is None or df_game.empty:
         cells = [" "] * 10
         run_cells = [""] * 10
         total_str, max_str = "0", "300"
     else:
-        shots = df_game.sort_values(by=['frame_number', 'shot_number', 'id']).to_dict('records')
-        by_frame = {}
-        for s in shots:
-            fn = int(s['frame_number'])
-            if fn not in by_frame:
-                by_frame[fn] = []
-            by_frame[fn].append(s)
+        # Column arrays sorted once by (frame, shot, id); frame f's deliveries are then one contiguous slice
+        frames = df_game['frame_number'].fillna(0).to_numpy(dtype=np.int64)
+        order = np.lexsort((df_game['id'].to_numpy(), df_game['shot_number'].fillna(0).to_numpy(dtype=np.int64), frames))
+        frames = frames[order]
+        # Plain Python lists for the per-cell loop: scalar indexing into numpy arrays is far slower than into lists
+        results = df_game['shot_result'].fillna('').to_numpy(dtype=object)[order].tolist()
+        left_masks = _mask_column(df_game, 'pins_left_mask')[order].tolist()
+        knocked_counts = _POPCOUNT[_mask_column(df_game, 'pins_knocked_mask')][order].tolist()
+        starts = np.searchsorted(frames, np.arange(1, 12)).tolist()
         cells = []
-        for f in range(1, 11):
-            if f not in by_frame:
-                cells.append(" ")
-                continue
-            fr = by_frame[f]
-            if len(fr) == 1:
-                cells.append(_shot_display_symbol(fr[0], True))
-            elif len(fr) == 2:
-                cells.append(f"{_shot_display_symbol(fr[0], True)} {_shot_display_symbol(fr[1], False)}")
-            else:
-                cells.append(f"{_shot_display_symbol(fr[0], True)} {_shot_display_symbol(fr[1], False)} {_shot_display_symbol(fr[2], False)}")
+        for f in range(10):
+            lo, hi = starts[f], min(starts[f + 1], starts[f] + 3)
+            symbols = [_shot_display_symbol(results[j], left_masks[j], knocked_counts[j], j == lo) for j in range(lo, hi)]
+            cells.append(" ".join(symbols) if symbols else " ")
         total_str, max_str = str(total_score), str(max_score)
         run_cells = [str(frame_scores[f - 1]) if f - 1 < len(frame_scores) and frame_scores[f - 1] is not None else "" for f in range(1, 11)]
 
-    header = "".join(f"<th style='border:1px solid #ccc;padding:6px 8px;color:#1a1a1a;background:#e0e0e0;'>{f}</th>" for f in range(1, 11)) + "<th style='border:1px solid #ccc;padding:6px 8px;color:#1a1a1a;background:#e0e0e0;'>Total</th><th style='border:1px solid #ccc;padding:6px 8px;color:#1a1a1a;background:#e0e0e0;'>Max</th>"
-    row1 = "".join(f"<td style='border:1px solid #ccc;padding:6px 8px;text-align:center;'>{_html_esc(c)}</td>" for c in cells) + f"<td style='border:1px solid #ccc;padding:6px 8px;text-align:center;font-weight:bold;'>{total_str}</td><td style='border:1px solid #ccc;padding:6px 8px;text-align:center;'>{max_str}</td>"
-    row2 = "".join(f"<td style='border:1px solid #ccc;padding:6px 8px;text-align:center;'>{_html_esc(r)}</td>" for r in run_cells) + "<td></td><td></td>"
-    st.markdown(
-        f"<table style='border-collapse:collapse;margin:8px 0;'>"
-        f"<thead><tr>{header}</tr></thead>"
+    row1 = "".join(f"<td>{_html_esc(c)}</td>" for c in cells) + f"<td class='total'>{total_str}</td><td>{max_str}</td>"
+    row2 = "".join(f"<td>{_html_esc(r)}</td>" for r in run_cells) + "<td></td><td></td>"
+    return (
+        f"{_SCORE_SHEET_CSS}<table class='scoresheet'>"
+        f"<thead><tr>{_SCORE_SHEET_HEADER}</tr></thead>"
         f"<tbody><tr>{row1}</tr><tr>{row2}</tr></tbody>"
-        f"</table>",
-        unsafe_allow_html=True,
+        f"</table>"
     )
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def _cached_score_sheet_html(game_id, version, _df_game):
+    """_score_sheet_html keyed like _cached_game_scores, so reruns without a new shot reuse the markup."""
+    return _score_sheet_html(_df_game, *_cached_game_scores(game_id, version, _df_game))
+
+def render_score_sheet(game_id, version, df_game):
+    """Draw the score sheet for one game (df_game holds its shots at the given set version)."""
+    st.markdown(_cached_score_sheet_html(game_id, version, df_game), unsafe_allow_html=True)
+
 
 # --- Azure Integration ---
+@st.cache_resource(show_spinner=False)
+def _blob_service_client(connection_string, account_name):
+    """One BlobServiceClient per credential set, reused across reruns (no per-click TLS/credential setup)."""
+    if connection_string:
+        return BlobServiceClient.from_connection_string(connection_string)
+    return BlobServiceClient(account_url=f"https://{account_name}.blob.core.windows.net", credential=DefaultAzureCredential())
+
 def get_azure_client():
     try:
         container_name = st.secrets.get("AZURE_STORAGE_CONTAINER_NAME")
@@ -394,10 +602,8 @@ def get_azure_client():
             st.error("Azure secret `AZURE_STORAGE_CONTAINER_NAME` not found.")
             return None
 
-        if connection_string:
-            return BlobServiceClient.from_connection_string(connection_string)
-        elif account_name:
-            return BlobServiceClient(account_url=f"https://{account_name}.blob.core.windows.net", credential=DefaultAzureCredential())
+        if connection_string or account_name:
+            return _blob_service_client(connection_string, account_name)
         else:
             st.error("Azure credentials not found. Please add `AZURE_STORAGE_CONNECTION_STRING` or `AZURE_STORAGE_ACCOUNT_NAME`.")
             return None
@@ -418,13 +624,21 @@ def get_storage_account_name_from_secrets():
     except Exception:
         return None
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _list_set_blobs(_container_client, container_name):
+    """(name, last_modified, etag) for every saved set, filtered by prefix server-side.
+
+    One cached LIST serves both the Azure Storage and Historical Analysis panels.
+    """
+    return [(b.name, b.last_modified, b.etag) for b in _container_client.list_blobs(name_starts_with="set-")]
+
 def upload_set_to_azure(con, set_id):
     blob_service_client = get_azure_client()
     if not blob_service_client: return
 
     try:
         container_name = st.secrets["AZURE_STORAGE_CONTAINER_NAME"]
-        df = con.execute("SELECT * FROM shots WHERE set_id = ?", [set_id]).fetchdf()
+        df = con.execute(_statement("SELECT * FROM shots WHERE set_id = ?"), [set_id]).fetchdf()
         if df.empty:
             st.warning("No data in this set to save.")
             return
@@ -433,22 +647,43 @@ def upload_set_to_azure(con, set_id):
         bowling_center = "Unknown"
         if 'bowling_center' in df.columns and pd.notna(df['bowling_center'].iloc[0]) and str(df['bowling_center'].iloc[0]).strip():
             bowling_center = str(df['bowling_center'].iloc[0]).strip().replace(' ', '_')
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        
-        blob_name = f"set-{set_name.replace(' ', '_')}-{bowling_center}-{set_id}.csv"
+        # Gzip straight into a bytes buffer and hand the buffer to the SDK (no str copy).
+        # The masks are left out: loads rebuild them from the text columns, and the blob keeps the pre-mask schema
+        csv_buffer = io.BytesIO()
+        df.drop(columns=['pins_left_mask', 'pins_knocked_mask'], errors='ignore').to_csv(csv_buffer, index=False, compression='gzip')
+        payload_size = csv_buffer.tell()
+        csv_buffer.seek(0)
+
+        blob_name = f"set-{set_name.replace(' ', '_')}-{bowling_center}-{set_id}.csv.gz"
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        blob_client.upload_blob(csv_buffer.getvalue(), overwrite=True)
+        # Known length: the SDK sends the buffer as-is instead of probing the stream for its size
+        blob_client.upload_blob(csv_buffer, length=payload_size, overwrite=True, content_settings=ContentSettings(content_type="application/gzip"))
 
         # Option A: one blob per set — delete any other blob whose name contains this set_id
         container_client = blob_service_client.get_container_client(container_name)
-        for b in container_client.list_blobs(name_starts_with="set-"):
-            if set_id in b.name and b.name != blob_name:
-                container_client.delete_blob(b.name)
+        # The set id sits at the end of the name, so no server-side prefix can select one set's blobs. List live rather
+        # than through the panels' cached _list_set_blobs: a blob saved elsewhere within its TTL must not survive
+        stale_blobs = [b.name for b in container_client.list_blobs(name_starts_with="set-") if set_id in b.name and b.name != blob_name]
+        if stale_blobs:
+            # One batch request for all of them instead of a round trip per blob; one already removed elsewhere is not an error
+            container_client.delete_blobs(*stale_blobs, raise_on_any_failure=False)
 
         st.success(f"Set '{set_name}' saved successfully to Azure.")
     except Exception as e:
         st.error(f"An unexpected error occurred during upload: {e}")
+    finally:
+        # Also after a failure: a listing that made this save fail must not be reused by the next attempt
+        _list_set_blobs.clear()
+
+def _read_set_blob(blob_name, data):
+    """Parse downloaded set bytes; .csv.gz blobs are gzip-compressed, older .csv blobs are plain.
+    Uses pyarrow's multi-threaded CSV reader (a Streamlit dependency, ~2x faster; shot_timestamp comes back
+    as a real timestamp), falling back to the C parser for files it rejects."""
+    compression = 'gzip' if blob_name.endswith('.gz') else None
+    try:
+        return pd.read_csv(io.BytesIO(data), compression=compression, engine='pyarrow')
+    except Exception:
+        return pd.read_csv(io.BytesIO(data), compression=compression)
 
 def download_and_load_set(blob_name):
     blob_service_client = get_azure_client()
@@ -459,7 +694,7 @@ def download_and_load_set(blob_name):
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
         
         downloader = blob_client.download_blob()
-        df = pd.read_csv(io.BytesIO(downloader.readall()))
+        df = _read_set_blob(blob_name, downloader.readall())
 
         if 'set_id' not in df.columns:
             st.error("Downloaded file is not a valid set file.")
@@ -469,14 +704,24 @@ def download_and_load_set(blob_name):
             df['bowling_center'] = ''
         if 'split_name' not in df.columns:
             df['split_name'] = None
+        # Masks are derived from the text columns, so older blobs without them load the same way
+        df['pins_left_mask'] = [_pins_str_mask(v) for v in df['pins_left']]
+        df['pins_knocked_mask'] = [_pins_str_mask(v) for v in df['pins_knocked_down']]
 
         set_id_to_load = df['set_id'].iloc[0]
-        con.execute("DELETE FROM shots WHERE set_id = ?", (set_id_to_load,))
-        
-        con.register('df_to_insert', df)
-        con.execute('INSERT INTO shots SELECT * FROM df_to_insert')
-        con.unregister('df_to_insert')
-        con.commit()
+        # Replace the set atomically: a failed INSERT must not leave the set deleted
+        con.begin()
+        try:
+            con.execute(_statement(_DELETE_SET_SQL), (set_id_to_load,))
+            con.register('df_to_insert', df)
+            con.execute('INSERT INTO shots BY NAME SELECT * FROM df_to_insert')
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            con.unregister('df_to_insert')
+        _invalidate_shot_caches()
 
         st.success(f"Successfully loaded set '{df['set_name'].iloc[0]}'.")
         st.session_state.set_id = set_id_to_load
@@ -486,72 +731,83 @@ def download_and_load_set(blob_name):
     except Exception as e:
         st.error(f"Failed to download or load set: {e}")
 
-def _derive_shot_result_and_pins_from_pins_left(row, edited_df):
-    """Given a row and the full edited df, derive shot_result and pins_knocked_down from pins_left."""
-    frame = row.get('frame_number')
-    shot = row.get('shot_number')
-    pins_left_str = row.get('pins_left')
-    pins_left = get_pins_from_str(pins_left_str) if pins_left_str is not None else []
-    if shot == 1:
-        if not pins_left or len(pins_left) == 0:
-            return 'Strike', '1, 2, 3, 4, 5, 6, 7, 8, 9, 10'
-        return 'Leave', ', '.join(str(p) for p in range(1, 11) if p not in pins_left)
-    else:
-        shot1_row = edited_df[(edited_df['game_id'] == row['game_id']) & (edited_df['frame_number'] == frame) & (edited_df['shot_number'] == 1)]
-        if shot1_row.empty:
-            return row.get('shot_result'), row.get('pins_knocked_down')
-        pins_after_1 = get_pins_from_str(shot1_row.iloc[0].get('pins_left'))
-        if not pins_after_1:
-            pins_after_1 = list(range(1, 11))
-        if not pins_left or len(pins_left) == 0:
-            return 'Spare', ', '.join(str(p) for p in pins_after_1)
-        knocked_2 = [p for p in pins_after_1 if p not in pins_left]
-        return 'Open', ', '.join(str(p) for p in knocked_2) if knocked_2 else 'N/A'
-
 def apply_edits_to_db(con, edited_df):
     """Persist edited dataframe to DB. Derives shot_result/pins_knocked_down/split_name from pins_left for consistency."""
     if edited_df is None or edited_df.empty:
         return
-    for _, row in edited_df.iterrows():
-        sid = row.get('id')
-        if pd.isna(sid) or sid is None:
-            continue
-        shot_result, pins_knocked_down = _derive_shot_result_and_pins_from_pins_left(row, edited_df)
-        pins_left = row.get('pins_left')
-        pins_left_list = get_pins_from_str(pins_left) if pins_left is not None else []
-        split_name_val = None
-        if shot_result == "Leave" and row.get('shot_number') == 1 and pins_left_list:
-            sn = get_split_name(pins_left_list)
-            if sn:
-                shot_result = "Leave - Split"
-                split_name_val = sn
-        if pins_left is None or (isinstance(pins_left, float) and pd.isna(pins_left)):
-            pins_left_str = ''
-        else:
-            pins_left_str = str(pins_left).strip()
-            if pins_left_str.lower() == 'nan':
-                pins_left_str = ''
-        lane_number = row.get('lane_number')
-        bowling_ball = row.get('bowling_ball')
-        arrows_pos = row.get('arrows_pos')
-        breakpoint_pos = row.get('breakpoint_pos')
-        ball_reaction = row.get('ball_reaction')
-        con.execute("""
-            UPDATE shots SET shot_result=?, pins_knocked_down=?, pins_left=?, lane_number=?, bowling_ball=?, arrows_pos=?, breakpoint_pos=?, ball_reaction=?, split_name=?
-            WHERE id=?
-        """, (shot_result, pins_knocked_down, pins_left_str, lane_number, bowling_ball, arrows_pos, breakpoint_pos, ball_reaction, split_name_val, int(sid)))
-    con.commit()
-
-def download_blob_to_dataframe(blob_name):
-    """Download a single set blob from Azure and return as DataFrame, or None on error."""
-    blob_service_client = get_azure_client()
-    if not blob_service_client:
-        return None
+    edits = _edit_frame(edited_df)
+    if not edits.empty:
+        # One set-based UPDATE joined on id (DuckDB runs it vectorized; per-row UPDATEs are its worst case),
+        # in one transaction so a failure leaves no half-applied edits
+        con.begin()
+        try:
+            con.register('df_edits', edits)
+            con.execute(_UPDATE_EDITS_SQL)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            con.unregister('df_edits')
+    _invalidate_shot_caches()
+
+def _pins_left_text(value):
+    """Stored pins_left text for a grid cell: stripped, with empty / NaN / 'nan' cells as ''."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    text = str(value).strip()
+    return '' if text.lower() == 'nan' else text
+
+def _edit_frame(edited_df):
+    """_EDIT_COLUMNS frame for the edited rows that have an id. shot_result, pins_knocked_down and split_name
+    are re-derived from each row's pins_left, column-wise over the whole grid."""
+    # Shot-1 pins_left per (game, frame), built once instead of filtering the whole grid for every second ball
+    first_ball_left = {}
+    for game_id, frame, shot, pins_left in zip(edited_df['game_id'], edited_df['frame_number'], edited_df['shot_number'], edited_df['pins_left']):
+        if shot == 1:
+            first_ball_left.setdefault((game_id, frame), _pins_str_mask(pins_left))
+    rows = edited_df[edited_df['id'].notna()]
+    pins_left = [_pins_left_text(v) for v in rows['pins_left']]
+    left = np.array([_pins_str_mask(p) for p in pins_left], dtype=np.int64)
+    first = np.array([first_ball_left.get(key, -1) for key in zip(rows['game_id'], rows['frame_number'])], dtype=np.int64)
+    is_first = rows['shot_number'].eq(1).fillna(False).to_numpy(dtype=bool)
+    # A second ball whose frame has no shot 1 in the grid keeps its stored result and pins
+    kept = ~is_first & (first < 0)
+    # Second balls knock down from what the first left standing (all ten after a first-ball strike)
+    knocked = np.where(is_first, _ALL_PINS_MASK, np.where(first == 0, _ALL_PINS_MASK, first)) & ~left
+    split_name = np.where(is_first & (left != 0), _SPLIT_ARRAY[left], None)
+    shot_result = np.select(
+        [kept, is_first & (left == 0), is_first & split_name.astype(bool), is_first, left == 0],
+        [rows['shot_result'].to_numpy(dtype=object), 'Strike', 'Leave - Split', 'Leave', 'Spare'],
+        'Open',
+    )
+    pins_knocked_down = np.where(kept, rows['pins_knocked_down'].to_numpy(dtype=object), _PINS_STR_ARRAY[knocked])
+    pins_knocked_down[~is_first & ~kept & (knocked == 0)] = 'N/A'
+    knocked_mask = np.where(kept, [_pins_str_mask(v) for v in pins_knocked_down], knocked)
+    return pd.DataFrame({
+        'shot_result': shot_result,
+        'pins_knocked_down': pins_knocked_down,
+        'pins_left': pins_left,
+        'lane_number': rows['lane_number'].to_numpy(),
+        'bowling_ball': rows['bowling_ball'].to_numpy(),
+        'arrows_pos': rows['arrows_pos'].to_numpy(),
+        'breakpoint_pos': rows['breakpoint_pos'].to_numpy(),
+        'ball_reaction': rows['ball_reaction'].to_numpy(),
+        'split_name': split_name,
+        'pins_knocked_mask': knocked_mask,
+        'pins_left_mask': left,
+        'id': rows['id'].to_numpy(dtype=np.int64),
+    }, columns=_EDIT_COLUMNS)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _download_set_df(_container_client, blob_name, etag):
+    """Set blob as a DataFrame, cached per (blob_name, etag) so an unchanged blob is not re-downloaded."""
+    return _read_set_blob(blob_name, _container_client.download_blob(blob_name).readall())
+
+def download_blob_to_dataframe(container_client, blob_name, etag=None):
+    """Download a single set blob from Azure and return as DataFrame, or None on error. Safe to call from worker threads."""
     try:
-        container_name = st.secrets["AZURE_STORAGE_CONTAINER_NAME"]
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        downloader = blob_client.download_blob()
-        return pd.read_csv(io.BytesIO(downloader.readall()))
+        return _download_set_df(container_client, blob_name, etag)
     except Exception:
         return None
 
@@ -569,218 +825,263 @@ def initialize_set(set_id=None, set_name=None, bowling_center=None):
         st.session_state.game_number = 1
         st.session_state.current_frame = 1
         st.session_state.current_shot = 1
-        st.session_state.pins_left_after_first_shot = []
+        st.session_state.pins_left_after_first_shot_mask = 0
         st.session_state.starting_lane = "Left Lane"
         st.session_state.game_over = False
     else:
         st.session_state.set_id = set_id
         st.session_state.set_name = set_name
-        first_shot = con.execute("SELECT bowling_center FROM shots WHERE set_id = ? LIMIT 1", [set_id]).fetchone()
-        st.session_state.bowling_center = (first_shot[0] or "") if first_shot and first_shot[0] else ""
+        # Latest game and the set's bowling center in one round trip (both served by idx_shots_set)
+        latest_game = con.execute(_statement("""
+            SELECT game_id, game_number,
+                (SELECT bowling_center FROM shots WHERE set_id = $set_id LIMIT 1)
+            FROM shots WHERE set_id = $set_id
+            ORDER BY game_number DESC, id DESC LIMIT 1
+        """), {"set_id": set_id}).fetchone()
+        st.session_state.bowling_center = (latest_game[2] or "") if latest_game else ""
 
-        latest_game = con.execute("SELECT game_id, game_number FROM shots WHERE set_id = ? ORDER BY game_number DESC, id DESC LIMIT 1", [set_id]).fetchone()
         if latest_game:
-            st.session_state.game_id, st.session_state.game_number = latest_game
+            st.session_state.game_id, st.session_state.game_number = latest_game[:2]
             restore_game_state()
         else:
             st.session_state.game_id = f"game-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
             st.session_state.game_number = 1
             st.session_state.current_frame = 1
             st.session_state.current_shot = 1
-            st.session_state.pins_left_after_first_shot = []
+            st.session_state.pins_left_after_first_shot_mask = 0
             st.session_state.starting_lane = "Left Lane"
             st.session_state.game_over = False
 
 def restore_game_state():
     try:
-        latest_shot = con.execute("SELECT * FROM shots WHERE game_id = ? ORDER BY id DESC LIMIT 1", [st.session_state.game_id]).fetchone()
+        # Latest shot, first 10th-frame result and starting lane in one round trip
+        latest_shot = con.execute(_statement("""
+            WITH last_shot AS (
+                SELECT frame_number, shot_number, shot_result, COALESCE(pins_left_mask, 0) AS pins_left_mask
+                FROM shots WHERE game_id = $game_id ORDER BY id DESC LIMIT 1
+            )
+            SELECT l.frame_number, l.shot_number, l.shot_result, l.pins_left_mask,
+                (SELECT shot_result FROM shots WHERE game_id = $game_id AND frame_number = 10 ORDER BY shot_number, id LIMIT 1),
+                (SELECT lane_number FROM shots WHERE game_id = $game_id AND frame_number = 1 AND shot_number = 1 LIMIT 1)
+            FROM last_shot l
+        """), {"game_id": st.session_state.game_id}).fetchone()
         if not latest_shot:
             st.session_state.current_frame = 1
             st.session_state.current_shot = 1
-            st.session_state.pins_left_after_first_shot = []
+            st.session_state.pins_left_after_first_shot_mask = 0
             st.session_state.starting_lane = "Left Lane"
             st.session_state.game_over = False
             return
 
-        (id, set_id, set_name, game_id, game_number, frame, shot,
-         shot_result, _, pins_left_str, _, *__) = latest_shot
+        frame, shot, shot_result, pins_left, shot1_res, starting_lane = latest_shot
 
         if frame is None or shot is None:
             raise ValueError("Corrupted data in last shot.")
 
         next_frame, next_shot = frame, shot
-        pins_left = get_pins_from_str(pins_left_str)
         game_over = False
 
         if frame < 10:
             if shot == 2 or shot_result == "Strike":
                 next_frame += 1
                 next_shot = 1
-                pins_left = []
+                pins_left = 0
             else:
                 next_shot = 2
         else:
-            shots_in_frame10 = con.execute("SELECT shot_number, shot_result FROM shots WHERE game_id = ? AND frame_number = 10", [game_id]).fetchall()
-            shot1_res = shots_in_frame10[0][1] if len(shots_in_frame10) > 0 else ''
-
             if shot == 1:
                 next_shot = 2
-                if shot_result == "Strike": pins_left = []
+                if shot_result == "Strike": pins_left = 0
             elif shot == 2:
                 if shot1_res == "Strike" or shot_result == "Spare":
                     next_shot = 3
-                    pins_left = []
+                    pins_left = 0
                 else: game_over = True
             else:
                 game_over = True
 
         st.session_state.current_frame = next_frame
         st.session_state.current_shot = next_shot
-        st.session_state.pins_left_after_first_shot = pins_left
+        st.session_state.pins_left_after_first_shot_mask = pins_left
         st.session_state.game_over = game_over
 
-        first_shot_of_game = con.execute("SELECT lane_number FROM shots WHERE game_id = ? AND frame_number = 1 AND shot_number = 1", [game_id]).fetchone()
-        st.session_state.starting_lane = first_shot_of_game[0] if first_shot_of_game else "Left Lane"
+        st.session_state.starting_lane = starting_lane if starting_lane is not None else "Left Lane"
 
     except Exception as e:
         st.warning(f"Could not restore game state due to an error: {e}. Starting a fresh game.")
         st.session_state.current_frame = 1
         st.session_state.current_shot = 1
-        st.session_state.pins_left_after_first_shot = []
+        st.session_state.pins_left_after_first_shot_mask = 0
         st.session_state.game_over = False
 
 if 'set_id' not in st.session_state:
     initialize_set()
 
 # --- Sidebar ---
-st.sidebar.header("Set Management")
-
-all_sets_from_db = con.execute("SELECT DISTINCT set_id, set_name FROM shots ORDER BY set_name DESC").fetchall()
-set_map = {s[0]: s[1] for s in all_sets_from_db}
-if st.session_state.get('set_id') not in set_map and st.session_state.get('set_name'):
-    set_map[st.session_state.set_id] = st.session_state.set_name
-
-if set_map:
-    try:
-        current_set_index = list(set_map.keys()).index(st.session_state.set_id)
-    except (ValueError, KeyError):
-        current_set_index = 0
-
-    selected_set_name = st.sidebar.selectbox("Select Set", options=list(set_map.values()), index=current_set_index)
-    if set_map and selected_set_name in set_map.values():
-        selected_set_id = [sid for sid, name in set_map.items() if name == selected_set_name][0]
-
+# Sequence number for a new set named like "League mm-dd-yy": 1 when that day has no sets yet, else one past the
+# highest "_N" suffix (the unsuffixed first set counts as 1). The suffix is parsed by DuckDB's regexp_extract
+_NEXT_SET_SEQ_SQL = """
+    SELECT CASE WHEN COUNT(*) = 0 THEN 1
+        ELSE COALESCE(MAX(TRY_CAST(NULLIF(regexp_extract(set_name, '_(\\d+)$', 1), '') AS INTEGER)), 1) + 1 END
+    FROM shots WHERE set_name LIKE ?
+"""
+
+# The sidebar panels are fragments: typing or picking in them reruns only that panel, not the DB/scoring path.
+# Anything that changes what the rest of the page shows ends in a full st.rerun()
+@st.fragment
+def set_management_panel():
+    st.header("Set Management")
+
+    all_sets_from_db = _load_all_sets()
+    set_map = {s[0]: s[1] for s in all_sets_from_db}
+    if st.session_state.get('set_id') not in set_map and st.session_state.get('set_name'):
+        set_map[st.session_state.set_id] = st.session_state.set_name
+
+    if set_map:
+        set_ids = list(set_map)
+        current_set_index = set_ids.index(st.session_state.set_id) if st.session_state.set_id in set_map else 0
+        # Name -> id (first set wins on duplicate names). Options stay names: two sets named alike on the
+        # same day must not share a widget whose stored value is a stale id.
+        set_id_by_name = {}
+        for sid, name in set_map.items():
+            set_id_by_name.setdefault(name, sid)
+
+        selected_set_name = st.selectbox("Select Set", options=list(set_map.values()), index=current_set_index)
+        selected_set_id = set_id_by_name[selected_set_name]
         if selected_set_id != st.session_state.set_id:
             initialize_set(selected_set_id, selected_set_name)
             st.rerun()
 
-st.sidebar.caption("Start New Set (bowling center required)")
-new_set_bowling_center = st.sidebar.text_input("Bowling center name", key="new_set_bowling_center", placeholder="e.g. Riverside Lanes")
-if st.sidebar.button("Start New Set", disabled=not (new_set_bowling_center and str(new_set_bowling_center).strip())):
-    today_str = datetime.datetime.now().strftime('%m-%d-%y')
-    base_name = f"League {today_str}"
-    existing_sets_today = con.execute("SELECT set_name FROM shots WHERE set_name LIKE ? ORDER BY set_name DESC", [f"{base_name}%"]).fetchall()
-
-    next_seq = 1
-    if existing_sets_today:
-        last_set_name = existing_sets_today[0][0]
-        match = re.search(r'_(\d+)$', last_set_name)
-        if match: next_seq = int(match.group(1)) + 1
-        else: next_seq = 2
-
-    new_set_name = f"{base_name}_{next_seq}" if next_seq > 1 else base_name
-    initialize_set(set_name=new_set_name, bowling_center=str(new_set_bowling_center).strip())
-    st.rerun()
+    st.caption("Start New Set (bowling center required)")
+    new_set_bowling_center = st.text_input("Bowling center name", key="new_set_bowling_center", placeholder="e.g. Riverside Lanes")
+    if st.button("Start New Set", disabled=not (new_set_bowling_center and str(new_set_bowling_center).strip())):
+        today_str = datetime.datetime.now().strftime('%m-%d-%y')
+        base_name = f"League {today_str}"
+        next_seq = con.execute(_statement(_NEXT_SET_SEQ_SQL), [f"{base_name}%"]).fetchone()[0]
 
-new_name = st.sidebar.text_input("Rename Current Set", value=st.session_state.get('set_name', ''))
-if st.sidebar.button("Rename Set"):
-    if new_name:
-        con.execute("UPDATE shots SET set_name = ? WHERE set_id = ?", (new_name, st.session_state.set_id))
-        con.commit()
-        st.session_state.set_name = new_name
+        new_set_name = f"{base_name}_{next_seq}" if next_seq > 1 else base_name
+        initialize_set(set_name=new_set_name, bowling_center=str(new_set_bowling_center).strip())
         st.rerun()
 
-with st.sidebar.expander("🎳 Manage Arsenal"):
-    st.markdown("**Your Full Arsenal**")
-    arsenal = [row[0] for row in con.execute("SELECT ball_name FROM arsenal ORDER BY ball_name").fetchall()]
+    new_name = st.text_input("Rename Current Set", value=st.session_state.get('set_name', ''))
+    if st.button("Rename Set"):
+        if new_name:
+            con.execute(_statement(_RENAME_SET_SQL), (new_name, st.session_state.set_id))
+            con.commit()
+            _invalidate_shot_caches()
+            st.session_state.set_name = new_name
+            st.rerun()
 
-    if 'balls_in_bag' not in st.session_state:
-        st.session_state.balls_in_bag = arsenal
+@st.fragment
+def arsenal_panel():
+    with st.expander("🎳 Manage Arsenal"):
+        st.markdown("**Your Full Arsenal**")
+        arsenal = _load_arsenal()
 
-    st.multiselect(
-        "Select balls in your bag for this session:",
-        options=arsenal,
-        key="balls_in_bag"
-    )
+        if 'balls_in_bag' not in st.session_state:
+            st.session_state.balls_in_bag = arsenal
 
-    new_ball_name = st.text_input("Add New Ball to Arsenal")
-    if st.button("Add Ball"):
-        if new_ball_name and new_ball_name not in arsenal:
-            con.execute("INSERT INTO arsenal (ball_name) VALUES (?)", (new_ball_name,))
-            con.commit()
-            st.success(f"Added '{new_ball_name}' to your arsenal.")
-            st.session_state.balls_in_bag.append(new_ball_name)
-            st.rerun()
-        elif not new_ball_name:
-            st.warning("Please enter a ball name.")
-        else:
-            st.warning(f"'{new_ball_name}' is already in your arsenal.")
+        def mark_bag_changed():
+            st.session_state.bag_changed = True
 
-with st.sidebar.expander("☁️ Azure Cloud Storage"):
-    if st.button("Save Current Set to Azure"):
-        upload_set_to_azure(con, st.session_state.set_id)
+        st.multiselect(
+            "Select balls in your bag for this session:",
+            options=arsenal,
+            key="balls_in_bag",
+            on_change=mark_bag_changed,
+        )
 
-    azure_client = get_azure_client()
-    if azure_client:
-        try:
-            container_name = st.secrets["AZURE_STORAGE_CONTAINER_NAME"]
-            container_client = azure_client.get_container_client(container_name)
-            blob_list = [b.name for b in container_client.list_blobs() if b.name.startswith('set-')]
-            if blob_list:
-                selected_blob = st.selectbox("Load Set from Azure", options=blob_list)
-                if st.button("Download and Load Set"):
-                    download_and_load_set(selected_blob)
+        new_ball_name = st.text_input("Add New Ball to Arsenal")
+        if st.button("Add Ball"):
+            if new_ball_name and new_ball_name not in arsenal:
+                con.execute(_statement("INSERT INTO arsenal (ball_name) VALUES (?)"), (new_ball_name,))
+                con.commit()
+                _load_arsenal.clear()
+                st.success(f"Added '{new_ball_name}' to your arsenal.")
+                st.session_state.balls_in_bag.append(new_ball_name)
+                st.rerun()
+            elif not new_ball_name:
+                st.warning("Please enter a ball name.")
             else:
-                st.write("No sets found in Azure.")
-        except Exception as e:
-            st.error(f"Could not list Azure blobs: {e}")
+                st.warning(f"'{new_ball_name}' is already in your arsenal.")
 
-with st.sidebar.expander("📜 Historical Analysis"):
-    st.caption("Select saved sets (newest first) and ask for a game plan.")
-    azure_client_ha = get_azure_client()
-    historical_blob_options = []
-    if azure_client_ha:
-        try:
-            container_name = st.secrets.get("AZURE_STORAGE_CONTAINER_NAME")
-            if container_name:
-                container_client = azure_client_ha.get_container_client(container_name)
-                blobs = [b for b in container_client.list_blobs() if b.name.startswith('set-')]
-                def _blob_sort_key(b):
-                    t = b.last_modified
-                    if t is None:
-                        return (0, datetime.datetime.min)
-                    return (1, t)
-                blobs_sorted = sorted(blobs, key=_blob_sort_key, reverse=True)
-                historical_blob_options = [b.name for b in blobs_sorted]
-        except Exception:
-            pass
-    if historical_blob_options:
-        st.multiselect("Select sets", options=historical_blob_options, key="historical_sets", default=[])
-        st.text_area("Your goal or question", key="historical_goal", placeholder="e.g. Look at my last 4 sets and give me a game plan for tonight...", height=80)
-        if st.button("Get game plan", key="btn_historical_plan"):
-            st.session_state.run_historical_plan = True
-            st.rerun()
-    else:
-        st.info("Save sets to Azure first, then they will appear here.")
+    if st.session_state.pop('bag_changed', False):
+        # The shot form's ball picker and the coach's bag summary live outside this fragment
+        st.rerun()
 
-with st.sidebar.expander("🤖 AI Settings"):
-    model_options = {
-        "Gemini 2.5 Flash (Recommended)": "gemini-2.5-flash",
-        "Gemini 1.5 Flash (Economical)": "gemini-1.5-flash"
-    }
-    selected_model_label = st.selectbox("Select AI Model", options=list(model_options.keys()))
-    selected_model_id = model_options[selected_model_label]
-    st.session_state.selected_model_id = selected_model_id
+@st.fragment
+def azure_panel():
+    with st.expander("☁️ Azure Cloud Storage"):
+        if st.button("Save Current Set to Azure"):
+            upload_set_to_azure(con, st.session_state.set_id)
+
+        azure_client = get_azure_client()
+        if azure_client:
+            try:
+                container_name = st.secrets["AZURE_STORAGE_CONTAINER_NAME"]
+                container_client = azure_client.get_container_client(container_name)
+                blob_list = [name for name, _, _ in _list_set_blobs(container_client, container_name)]
+                if blob_list:
+                    selected_blob = st.selectbox("Load Set from Azure", options=blob_list)
+                    if st.button("Download and Load Set"):
+                        download_and_load_set(selected_blob)
+                else:
+                    st.write("No sets found in Azure.")
+            except Exception as e:
+                st.error(f"Could not list Azure blobs: {e}")
+
+@st.fragment
+def historical_analysis_panel():
+    with st.expander("📜 Historical Analysis"):
+        st.caption("Select saved sets (newest first) and ask for a game plan.")
+        azure_client_ha = get_azure_client()
+        historical_blob_options = []
+        historical_blob_etags = {}
+        if azure_client_ha:
+            try:
+                container_name = st.secrets.get("AZURE_STORAGE_CONTAINER_NAME")
+                if container_name:
+                    container_client = azure_client_ha.get_container_client(container_name)
+                    blobs = _list_set_blobs(container_client, container_name)
+                    def _blob_sort_key(b):
+                        t = b[1]
+                        if t is None:
+                            return (0, datetime.datetime.min)
+                        return (1, t)
+                    blobs_sorted = sorted(blobs, key=_blob_sort_key, reverse=True)
+                    historical_blob_options = [name for name, _, _ in blobs_sorted]
+                    historical_blob_etags = {name: etag for name, _, etag in blobs_sorted}
+            except Exception:
+                pass
+        # Read by the game-plan run further down, which happens outside this fragment
+        st.session_state.historical_blob_etags = historical_blob_etags
+        if historical_blob_options:
+            st.multiselect("Select sets", options=historical_blob_options, key="historical_sets", default=[])
+            st.text_area("Your goal or question", key="historical_goal", placeholder="e.g. Look at my last 4 sets and give me a game plan for tonight...", height=80)
+            if st.button("Get game plan", key="btn_historical_plan"):
+                st.session_state.run_historical_plan = True
+                st.rerun()
+        else:
+            st.info("Save sets to Azure first, then they will appear here.")
+
+@st.fragment
+def ai_settings_panel():
+    with st.expander("🤖 AI Settings"):
+        model_options = {
+            "Gemini 2.5 Flash (Recommended)": "gemini-2.5-flash",
+            "Gemini 1.5 Flash (Economical)": "gemini-1.5-flash"
+        }
+        selected_model_label = st.selectbox("Select AI Model", options=list(model_options.keys()))
+        selected_model_id = model_options[selected_model_label]
+        # Read when a coach request runs, so the model switch needs no full rerun
+        st.session_state.selected_model_id = selected_model_id
+
+with st.sidebar:
+    set_management_panel()
+    arsenal_panel()
+    azure_panel()
+    historical_analysis_panel()
+    ai_settings_panel()
 
 with st.sidebar.expander("⚠️ Danger Zone"):
     storage_account_name = get_storage_account_name_from_secrets()
@@ -791,24 +1092,37 @@ with st.sidebar.expander("⚠️ Danger Zone"):
     else:
         st.caption("Add AZURE_STORAGE_CONNECTION_STRING or AZURE_STORAGE_ACCOUNT_NAME to secrets to see a link here.")
     if st.button("Delete Current Set"):
-        con.execute("DELETE FROM shots WHERE set_id = ?", (st.session_state.set_id,))
+        con.execute(_statement(_DELETE_SET_SQL), (st.session_state.set_id,))
         con.commit()
+        _invalidate_shot_caches()
         st.success(f"Set '{st.session_state.set_name}' has been deleted.")
         initialize_set()
         st.rerun()
 
 # --- Save Edits (run before refetch so next run sees updated data) ---
 def _parse_game_frame_shot(gfs):
-    """Parse 'game-frame-shot' string to (game_number, frame_number, shot_number)."""
-    if pd.isna(gfs) or gfs is None or str(gfs).strip() == "":
-        return None, None, None
-    parts = str(gfs).strip().split("-")
-    if len(parts) != 3:
-        return None, None, None
-    try:
-        return int(parts[0]), int(parts[1]), int(parts[2])
-    except (ValueError, TypeError):
-        return None, None, None
+    """Parse a 'game-frame-shot' column into Int64 game/frame/shot columns (<NA> where a key is malformed)."""
+    parts = gfs.astype(str).str.extract(r"^\s*(\d+)\s*-\s*(\d+)\s*-\s*(\d+)\s*$")
+    return parts.apply(pd.to_numeric).astype("Int64")
+
+def _merge_grid_edits(full_df, edited):
+    """Copy the grid's edited values onto full_df rows with the same game-frame-shot; returns the merged frame.
+    Keys are matched with one index lookup and each edited column is written in a single assignment."""
+    merged = full_df.copy()
+    edit_cols = [c for c in edited.columns if c != "game-frame-shot" and c in merged.columns]
+    keys = _parse_game_frame_shot(edited["game-frame-shot"])
+    parsed = keys.notna().all(axis=1).to_numpy()
+    edit_keys = pd.MultiIndex.from_frame(keys[parsed].astype("int64"))
+    # First grid row per key wins
+    first = ~edit_keys.duplicated()
+    edit_values = edited.loc[parsed, edit_cols][first]
+    pos = edit_keys[first].get_indexer(pd.MultiIndex.from_arrays(
+        [merged[c].astype("int64") for c in ("game_number", "frame_number", "shot_number")]))
+    matched = pos >= 0
+    if matched.any():
+        for col in edit_cols:
+            merged.loc[matched, col] = edit_values[col].to_numpy()[pos[matched]]
+    return merged
 
 if st.session_state.get('save_edits_clicked'):
     edited_data = st.session_state.get('pending_save_edits')
@@ -817,38 +1131,18 @@ if st.session_state.get('save_edits_clicked'):
     set_id_for_save = st.session_state.get('save_edits_set_id') or st.session_state.get('set_id')
     did_save = False
     if edited_data is not None and isinstance(edited_data, pd.DataFrame) and not edited_data.empty and set_id_for_save and "game-frame-shot" in edited_data.columns:
-        full_df = con.execute("SELECT * FROM shots WHERE set_id = ?", [set_id_for_save]).fetchdf()
-        full_df = full_df.sort_values(by=['game_number', 'frame_number', 'shot_number', 'id']).reset_index(drop=True)
+        full_df = con.execute(_statement(_SET_SHOTS_SQL), [set_id_for_save]).fetchdf()
         if not full_df.empty:
-            merged = full_df.copy()
-            edit_cols = [c for c in edited_data.columns if c != "game-frame-shot" and c in merged.columns]
-            for idx, full_row in merged.iterrows():
-                g, f, s = int(full_row["game_number"]), int(full_row["frame_number"]), int(full_row["shot_number"])
-                for ed_idx, edit_row in edited_data.iterrows():
-                    eg, ef, es = _parse_game_frame_shot(edit_row.get("game-frame-shot"))
-                    if (eg, ef, es) == (g, f, s):
-                        for col in edit_cols:
-                            merged.at[idx, col] = edit_row[col]
-                        break
+            merged = _merge_grid_edits(full_df, edited_data)
             apply_edits_to_db(con, merged)
             did_save = True
     elif edited_data is not None and not isinstance(edited_data, pd.DataFrame):
         try:
             df_edit = pd.DataFrame(edited_data)
             if not df_edit.empty and "game-frame-shot" in df_edit.columns and set_id_for_save:
-                full_df = con.execute("SELECT * FROM shots WHERE set_id = ?", [set_id_for_save]).fetchdf()
-                full_df = full_df.sort_values(by=['game_number', 'frame_number', 'shot_number', 'id']).reset_index(drop=True)
+                full_df = con.execute(_statement(_SET_SHOTS_SQL), [set_id_for_save]).fetchdf()
                 if not full_df.empty:
-                    merged = full_df.copy()
-                    edit_cols = [c for c in df_edit.columns if c != "game-frame-shot" and c in merged.columns]
-                    for idx, full_row in merged.iterrows():
-                        g, f, s = int(full_row["game_number"]), int(full_row["frame_number"]), int(full_row["shot_number"])
-                        for _, edit_row in df_edit.iterrows():
-                            eg, ef, es = _parse_game_frame_shot(edit_row.get("game-frame-shot"))
-                            if (eg, ef, es) == (g, f, s):
-                                for col in edit_cols:
-                                    merged.at[idx, col] = edit_row[col]
-                                break
+                    merged = _merge_grid_edits(full_df, df_edit)
                     apply_edits_to_db(con, merged)
                     did_save = True
         except Exception:
@@ -867,19 +1161,19 @@ if st.session_state.get('save_edits_clicked'):
 
 # --- Game Selection & Data Fetching ---
 st.sidebar.header("Game Management")
-df_set = con.execute("SELECT * FROM shots WHERE set_id = ?", [st.session_state.set_id]).fetchdf()
+set_version = _set_version(st.session_state.set_id)
+df_set = _load_set_df(st.session_state.set_id, set_version)
 if st.session_state.get('edits_saved_message'):
     st.success("Edits saved. Score sheet and totals updated.")
     del st.session_state['edits_saved_message']
 
 games_in_set = df_set['game_number'].unique()
 games_in_set.sort()
-game_map = {f"Game {g}": g for g in games_in_set}
-if st.session_state.game_number not in game_map.values():
-    game_map[f"Game {st.session_state.game_number}"] = st.session_state.game_number
+game_numbers = games_in_set.tolist()
+if st.session_state.game_number not in game_numbers:
+    game_numbers.append(st.session_state.game_number)
 
-selected_game_name = st.sidebar.selectbox("Select Game", options=list(game_map.keys()), index=list(game_map.values()).index(st.session_state.game_number))
-selected_game_number = game_map[selected_game_name]
+selected_game_number = st.sidebar.selectbox("Select Game", options=game_numbers, index=game_numbers.index(st.session_state.game_number), format_func=lambda g: f"Game {g}")
 
 if selected_game_number != st.session_state.game_number:
     st.session_state.game_number = selected_game_number
@@ -889,27 +1183,30 @@ if selected_game_number != st.session_state.game_number:
     st.rerun()
 
 if st.sidebar.button("Start New Game in Set"):
-    new_game_num = (max(games_in_set) if games_in_set.size > 0 else 0) + 1
-    # Next game starts on the opposite lane from the previous game (lane 1 = left, 2 = right)
+    # games_in_set is sorted, so its last entry is the set's latest game
+    prev_game_num = int(games_in_set[-1]) if games_in_set.size > 0 else 0
+    new_game_num = prev_game_num + 1
+    # Next game starts on the opposite lane from the previous game (lane 1 = left, 2 = right).
+    # Its first ball is already in df_set, loaded at the current version above
     prev_starting_lane = "Left Lane"
-    if games_in_set.size > 0:
-        prev_game_num = int(max(games_in_set))
-        prev_first = con.execute("SELECT lane_number FROM shots WHERE set_id = ? AND game_number = ? AND frame_number = 1 AND shot_number = 1", [st.session_state.set_id, prev_game_num]).fetchone()
-        if prev_first and prev_first[0]:
-            prev_starting_lane = prev_first[0]
+    if prev_game_num:
+        prev_first = df_set.loc[(df_set['game_number'] == prev_game_num) & (df_set['frame_number'] == 1) & (df_set['shot_number'] == 1), 'lane_number']
+        if not prev_first.empty and isinstance(prev_first.iloc[0], str) and prev_first.iloc[0]:
+            prev_starting_lane = prev_first.iloc[0]
     st.session_state.starting_lane = "Right Lane" if prev_starting_lane == "Left Lane" else "Left Lane"
     st.session_state.game_id = f"game-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
     st.session_state.game_number = new_game_num
     st.session_state.current_frame = 1
     st.session_state.current_shot = 1
-    st.session_state.pins_left_after_first_shot = []
+    st.session_state.pins_left_after_first_shot_mask = 0
     st.session_state.game_over = False
     st.rerun()
 
-df_current_game = df_set[df_set['game_number'] == st.session_state.game_number] if not df_set.empty else pd.DataFrame()
+# The current game is a slice of the set already in memory, not a second query per set version
+df_current_game = df_set[df_set['game_number'] == st.session_state.game_number].reset_index(drop=True)
 
 # --- Scoring Display ---
-frame_scores, total_score, max_score = calculate_scores(df_current_game)
+frame_scores, total_score, max_score = _cached_game_scores(st.session_state.game_id, set_version, df_current_game)
 st.sidebar.header(f"Game {st.session_state.game_number} Score")
 st.sidebar.metric("Total Score", total_score)
 if not st.session_state.game_over:
@@ -917,19 +1214,32 @@ if not st.session_state.game_over:
 
 # --- Shot Input Area ---
 st.header(f"Entering Data for: {st.session_state.set_name} - Game {st.session_state.game_number}")
-if st.session_state.game_over:
-    st.success("🎉 Game Over! Start a new game to continue.")
-else:
+
+def _shot_results_by_key(df_game):
+    """{(frame_number, shot_number): shot_result} for one game; the first row wins if a delivery is duplicated."""
+    results = {}
+    for frame, shot, result in zip(df_game['frame_number'], df_game['shot_number'], df_game['shot_result']):
+        results.setdefault((frame, shot), result)
+    return results
+
+# Board numbers offered for the arrows / breakpoint position pickers
+_BOARD_POSITIONS = tuple(range(1, 40))
+
+@st.fragment
+def shot_entry_panel(df_current_game):
+    """Shot input widgets. A fragment, so picking a result reruns only this panel; the rest is a form sent on Submit Shot."""
     st.subheader(f"Frame {st.session_state.current_frame} - Shot {st.session_state.current_shot}")
 
+    # (frame, shot) -> result, built once per panel run; only the 10th frame's choices depend on earlier balls
+    shot_results = _shot_results_by_key(df_current_game) if st.session_state.current_frame == 10 else {}
+
     col1, col2 = st.columns(2)
     with col1:
         shot_result_options = []
         if st.session_state.current_frame == 10:
             if st.session_state.current_shot == 1: shot_result_options = ["Strike", "Leave"]
             elif st.session_state.current_shot == 2:
-                shot1_res_df = df_current_game[(df_current_game['frame_number'] == 10) & (df_current_game['shot_number'] == 1)]
-                shot1_res = shot1_res_df['shot_result'].iloc[0] if not shot1_res_df.empty else ''
+                shot1_res = shot_results.get((10, 1), '')
                 shot_result_options = ["Strike", "Leave"] if shot1_res == 'Strike' else ["Spare", "Open"]
             else: shot_result_options = ["Strike", "Leave", "Open"]
         else:
@@ -941,85 +1251,42 @@ else:
             st.selectbox("Starting Lane", ["Left Lane", "Right Lane"], key="starting_lane")
 
         if 'starting_lane' not in st.session_state or not st.session_state.starting_lane:
-            first_shot_db = con.execute("SELECT lane_number FROM shots WHERE game_id = ? AND frame_number = 1 AND shot_number = 1", [st.session_state.game_id]).fetchone()
-            st.session_state.starting_lane = first_shot_db[0] if first_shot_db else "Left Lane"
+            first_shot = df_current_game.loc[(df_current_game['frame_number'] == 1) & (df_current_game['shot_number'] == 1), 'lane_number']
+            st.session_state.starting_lane = first_shot.iloc[0] if not first_shot.empty else "Left Lane"
 
         is_odd_frame = st.session_state.current_frame % 2 != 0
         starts_on_left = st.session_state.starting_lane == "Left Lane"
         lane_number = st.session_state.starting_lane if is_odd_frame else ("Right Lane" if starts_on_left else "Left Lane")
         st.markdown(f"**Current Lane:** {lane_number}")
 
-    # Ball Selection
-    balls_in_bag = st.session_state.get('balls_in_bag', [])
-    last_used_ball = st.session_state.get('last_used_ball')
-    default_index = 0
-    if last_used_ball and last_used_ball in balls_in_bag:
-        default_index = balls_in_bag.index(last_used_ball)
-    st.selectbox("Bowling Ball", options=balls_in_bag, key="bowling_ball", index=default_index)
-
-    if st.session_state.current_shot == 1 or (st.session_state.current_frame == 10 and st.session_state.current_shot > 1):
-        st.subheader("Ball Trajectory")
-        st.selectbox("Position at Arrows", options=list(range(1, 40)), index=16, key="arrows_pos")
-        st.selectbox("Position at Breakpoint", options=list(range(1, 40)), index=9, key="breakpoint_pos")
-
-    st.text_input("Ball Reaction", key="ball_reaction")
-
-    st.subheader("Pins Left Standing")
-    st.code("""
-    7   8   9   10
-      4   5   6
-        2   3
-          1
-    """, language=None)
-
-    is_spare_or_strike = st.session_state.shot_result in ["Spare", "Strike"]
-
-    if st.session_state.current_shot == 1:
-        options = list(range(1, 11))
-        help_text = "Select the pins left standing after your first shot."
-    else:
-        options = st.session_state.get('pins_left_after_first_shot', [])
-        help_text = "Select the pins still standing to record an open frame."
-
-    st.multiselect(
-        "Pins Left Standing",
-        options=options,
-        key="pins_left_multiselect",
-        help=help_text,
-        disabled=is_spare_or_strike
-    )
-
     def submit_shot():
         use_trajectory = st.session_state.current_shot == 1 or (st.session_state.current_frame == 10 and st.session_state.current_shot > 1)
         arrows = st.session_state.arrows_pos if use_trajectory else None
         breakpoint = st.session_state.breakpoint_pos if use_trajectory else None
 
         shot_res = st.session_state.shot_result
-        pins_left_standing = st.session_state.pins_left_multiselect
-        pins_knocked_down_str = "N/A"
+        # The pin picker isn't rendered for Strike/Spare, so its key may be stale or missing
+        pins_left_standing = [] if shot_res in ("Spare", "Strike") else st.session_state.get('pins_left_multiselect', [])
+        left_mask = _standing_mask(pins_left_standing)
 
         if st.session_state.current_shot == 1:
             if shot_res == "Strike":
-                st.session_state.pins_left_after_first_shot = []
-                pins_knocked_down_str = "1, 2, 3, 4, 5, 6, 7, 8, 9, 10"
+                st.session_state.pins_left_after_first_shot_mask = 0
+                knocked_mask = _ALL_PINS_MASK
             else:
-                st.session_state.pins_left_after_first_shot = pins_left_standing
-                knocked_down = [p for p in range(1, 11) if p not in pins_left_standing]
-                pins_knocked_down_str = ", ".join(map(str, knocked_down))
+                st.session_state.pins_left_after_first_shot_mask = left_mask
+                knocked_mask = _ALL_PINS_MASK & ~left_mask
         else:
-            prev_pins_left = st.session_state.get('pins_left_after_first_shot', [])
-            if shot_res == "Spare":
-                pins_knocked_down_str = ", ".join(map(str, prev_pins_left))
-            else:
-                knocked_down = [p for p in prev_pins_left if p not in pins_left_standing]
-                pins_knocked_down_str = ", ".join(map(str, knocked_down))
+            prev_mask = st.session_state.get('pins_left_after_first_shot_mask', 0)
+            knocked_mask = prev_mask if shot_res == "Spare" else prev_mask & ~left_mask
 
-        pins_left_standing_str = ", ".join(map(str, pins_left_standing))
+        pins_knocked_down_str = _PINS_STR_BY_MASK[knocked_mask]
+        pins_left_standing_str = _PINS_STR_BY_MASK[left_mask]
         st.session_state.last_used_ball = st.session_state.bowling_ball
 
         split_name_val = None
-        if shot_res == "Leave" and st.session_state.current_shot == 1 and pins_left_standing:
-            split_name_val = get_split_name(pins_left_standing)
+        if shot_res == "Leave" and st.session_state.current_shot == 1:
+            split_name_val = _SPLIT_TABLE[left_mask]
             if split_name_val:
                 shot_res = "Leave - Split"
 
@@ -1041,48 +1308,104 @@ else:
             str(st.session_state.ball_reaction) if st.session_state.ball_reaction else None,
             str(bowling_center) if bowling_center else None,
             str(split_name_val) if split_name_val else None,
+            knocked_mask,
+            left_mask,
         )
-        con.execute(
-            "INSERT INTO shots (set_id, set_name, game_id, game_number, frame_number, shot_number, shot_result, pins_knocked_down, pins_left, lane_number, bowling_ball, arrows_pos, breakpoint_pos, ball_reaction, bowling_center, split_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            ins_args,
-        )
-        con.commit()
+        # One autocommitted INSERT per shot (no commit() needed). Not buffered: the score sheet, totals and
+        # game-state restore read the shot back from the DB on the very next run, and a bowler submits at most
+        # one shot every few seconds, so batching would only add staleness and a window for lost shots
+        con.execute(_statement(_INSERT_SHOT_SQL), ins_args)
+        # The INSERT moves MAX(id), so the version-keyed loaders and scores pick it up without a clear
+        # (other sets/games stay cached); only a set's first shot adds it to the set list
+        if df_current_game.empty and st.session_state.game_number == 1:
+            _load_all_sets.clear()
 
         if st.session_state.current_frame < 10:
             if st.session_state.current_shot == 2 or shot_res == "Strike":
                 st.session_state.current_frame += 1
                 st.session_state.current_shot = 1
-                st.session_state.pins_left_after_first_shot = []
+                st.session_state.pins_left_after_first_shot_mask = 0
             else:
                 st.session_state.current_shot = 2
         else:
-            shot1_res_df = df_current_game[(df_current_game['frame_number'] == 10) & (df_current_game['shot_number'] == 1)]
-            shot1_res = shot1_res_df['shot_result'].iloc[0] if not shot1_res_df.empty else ''
+            shot1_res = shot_results.get((10, 1), '')
             if st.session_state.current_shot == 1:
                 st.session_state.current_shot = 2
-                if shot_res == "Strike": st.session_state.pins_left_after_first_shot = []
+                if shot_res == "Strike": st.session_state.pins_left_after_first_shot_mask = 0
             elif st.session_state.current_shot == 2:
                 if shot1_res == "Strike" or shot_res == "Spare":
                     st.session_state.current_shot = 3
-                    st.session_state.pins_left_after_first_shot = []
+                    st.session_state.pins_left_after_first_shot_mask = 0
                 else: st.session_state.game_over = True
             else:
                 st.session_state.game_over = True
 
         st.session_state.pins_left_multiselect = []
         st.session_state.ball_reaction = ""
+        st.session_state.shot_submitted = True
+
+    # Everything below the result/lane choice is batched in a form: typing a reaction or picking
+    # pins/trajectory no longer reruns anything until Submit Shot
+    with st.form("shot_form", border=False):
+        # Ball Selection
+        balls_in_bag = st.session_state.get('balls_in_bag', [])
+        last_used_ball = st.session_state.get('last_used_ball')
+        default_index = 0
+        if last_used_ball and last_used_ball in balls_in_bag:
+            default_index = balls_in_bag.index(last_used_ball)
+        st.selectbox("Bowling Ball", options=balls_in_bag, key="bowling_ball", index=default_index)
+
+        if st.session_state.current_shot == 1 or (st.session_state.current_frame == 10 and st.session_state.current_shot > 1):
+            st.subheader("Ball Trajectory")
+            st.selectbox("Position at Arrows", options=_BOARD_POSITIONS, index=16, key="arrows_pos")
+            st.selectbox("Position at Breakpoint", options=_BOARD_POSITIONS, index=9, key="breakpoint_pos")
+
+        st.text_input("Ball Reaction", key="ball_reaction")
+
+        # Strike/Spare leave nothing standing: skip the diagram and picker instead of sending them disabled
+        if st.session_state.shot_result not in ["Spare", "Strike"]:
+            st.subheader("Pins Left Standing")
+            st.code("""
+    7   8   9   10
+      4   5   6
+        2   3
+          1
+    """, language=None)
 
-    st.button("Submit Shot", use_container_width=True, on_click=submit_shot)
+            if st.session_state.current_shot == 1:
+                options = _ALL_PINS
+                help_text = "Select the pins left standing after your first shot."
+            else:
+                options = _PINS_BY_MASK[st.session_state.get('pins_left_after_first_shot_mask', 0)]
+                help_text = "Select the pins still standing to record an open frame."
+
+            st.multiselect(
+                "Pins Left Standing",
+                options=options,
+                key="pins_left_multiselect",
+                help=help_text,
+            )
+        st.form_submit_button("Submit Shot", use_container_width=True, on_click=submit_shot)
+
+    if st.session_state.pop('shot_submitted', False):
+        # Score sheet, totals and the data grid live outside this fragment
+        st.rerun()
+
+if st.session_state.game_over:
+    st.success("🎉 Game Over! Start a new game to continue.")
+else:
+    shot_entry_panel(df_current_game)
 
 # --- Score Sheet (current game) ---
 st.subheader(f"Score sheet — Game {st.session_state.game_number}")
 st.caption("Use the sidebar to select a game to compare.")
-render_score_sheet(df_current_game, frame_scores, total_score, max_score)
+render_score_sheet(st.session_state.game_id, set_version, df_current_game)
 
 # --- Analytical Dashboard (editable grid) ---
 st.header(f"📊 Data for Set: {st.session_state.set_name}")
 if not df_set.empty:
-    full_sorted = df_set.sort_values(by=['game_number', 'frame_number', 'shot_number', 'id']).reset_index(drop=True)
+    # _load_set_df already returns the set in game/frame/shot order
+    full_sorted = df_set
     visible_cols = [
         "shot_result", "pins_left", "lane_number", "bowling_ball", "arrows_pos", "breakpoint_pos",
         "ball_reaction", "split_name", "bowling_center", "set_name", "shot_timestamp"
@@ -1090,9 +1413,9 @@ if not df_set.empty:
     visible_cols = [c for c in visible_cols if c in full_sorted.columns]
     display_visible = full_sorted[visible_cols].copy()
     display_visible = display_visible.iloc[::-1].reset_index(drop=True)
-    gfs = full_sorted.iloc[::-1].reset_index(drop=True).apply(
-        lambda r: f"{int(r['game_number'])}-{int(r['frame_number'])}-{int(r['shot_number'])}", axis=1
-    )
+    newest_first = full_sorted.iloc[::-1].reset_index(drop=True)
+    gfs = (newest_first['game_number'].astype('int64').astype(str) + "-" + newest_first['frame_number'].astype('int64').astype(str)
+           + "-" + newest_first['shot_number'].astype('int64').astype(str))
     display_visible.insert(0, "game-frame-shot", gfs)
     # Coerce dtypes for Streamlit data_editor compatibility
     for col in display_visible.columns:
@@ -1104,6 +1427,12 @@ if not df_set.empty:
             display_visible[col] = display_visible[col].fillna("").astype(str).replace("nan", "")
         elif pd.api.types.is_integer_dtype(display_visible[col]) and display_visible[col].isna().any():
             display_visible[col] = display_visible[col].astype(float)
+    # The read-only text columns repeat a few values per set: as categoricals they go to the browser as small
+    # integer codes (~30% less Arrow payload per rerun). Editable columns stay text; a categorical would
+    # turn them into a fixed-choice picker
+    for col in ("split_name", "bowling_center", "set_name"):
+        if col in display_visible.columns:
+            display_visible[col] = display_visible[col].astype("category")
     # lane_number is VARCHAR (e.g. "Left Lane"); arrows/breakpoint can be int or float (NaN)
     column_config = {
         "game-frame-shot": st.column_config.TextColumn("game-frame-shot", disabled=True),
@@ -1135,19 +1464,9 @@ if not df_set.empty:
     if submitted and edited_visible is not None and not edited_visible.empty and "game-frame-shot" in edited_visible.columns:
         set_id_for_save = st.session_state.get("set_id")
         if set_id_for_save:
-            full_df = con.execute("SELECT * FROM shots WHERE set_id = ?", [set_id_for_save]).fetchdf()
-            full_df = full_df.sort_values(by=['game_number', 'frame_number', 'shot_number', 'id']).reset_index(drop=True)
+            full_df = con.execute(_statement(_SET_SHOTS_SQL), [set_id_for_save]).fetchdf()
             if not full_df.empty:
-                merged = full_df.copy()
-                edit_cols = [c for c in edited_visible.columns if c != "game-frame-shot" and c in merged.columns]
-                for idx, full_row in merged.iterrows():
-                    g, f, s = int(full_row["game_number"]), int(full_row["frame_number"]), int(full_row["shot_number"])
-                    for _, edit_row in edited_visible.iterrows():
-                        eg, ef, es = _parse_game_frame_shot(edit_row.get("game-frame-shot"))
-                        if (eg, ef, es) == (g, f, s):
-                            for col in edit_cols:
-                                merged.at[idx, col] = edit_row[col]
-                            break
+                merged = _merge_grid_edits(full_df, edited_visible)
                 apply_edits_to_db(con, merged)
                 st.success("Edits saved. Score sheet and totals will update.")
                 st.rerun()
@@ -1163,43 +1482,85 @@ if st.session_state.get('run_historical_plan'):
         st.warning("Select at least one set and enter your goal.")
         st.session_state.historical_plan_result = None
     else:
-        with st.spinner("Downloading sets and building your game plan..."):
+        with st.spinner("Downloading sets..."):
             dfs = []
-            for blob_name in selected_blobs:
-                d = download_blob_to_dataframe(blob_name)
-                if d is not None and not d.empty:
-                    dfs.append(d)
-            if dfs:
-                combined = pd.concat(dfs, ignore_index=True)
-                api_key_ha = st.secrets.get("GEMINI_API_KEY")
-                model_id_ha = st.session_state.get('selected_model_id', 'gemini-2.5-flash')
-                result = get_ai_historical_game_plan(api_key_ha, combined, goal, model_id_ha)
-                st.session_state.historical_plan_result = result
-            else:
-                st.session_state.historical_plan_result = None
-                st.error("Could not load any of the selected sets.")
-
-if st.session_state.get('historical_plan_result'):
+            azure_client_dl = get_azure_client()
+            if azure_client_dl:
+                container_client = azure_client_dl.get_container_client(st.secrets["AZURE_STORAGE_CONTAINER_NAME"])
+                blob_etags = st.session_state.get('historical_blob_etags', {})
+                # Downloads are network-bound; overlap them instead of paying one round trip per set
+                with ThreadPoolExecutor(max_workers=min(8, len(selected_blobs))) as executor:
+                    downloaded = executor.map(
+                        lambda name: download_blob_to_dataframe(container_client, name, blob_etags.get(name)),
+                        selected_blobs,
+                    )
+                    dfs = [d for d in downloaded if d is not None and not d.empty]
+        if dfs:
+            combined = pd.concat(dfs, ignore_index=True)
+            api_key_ha = st.secrets.get("GEMINI_API_KEY")
+            model_id_ha = st.session_state.get('selected_model_id', 'gemini-2.5-flash')
+            # Stream the plan as it is written; the finished text is kept for later reruns
+            st.header("📜 Historical game plan")
+            st.session_state.historical_plan_result = st.write_stream(
+                get_ai_historical_game_plan(api_key_ha, combined, goal, model_id_ha)
+            )
+            st.divider()
+        else:
+            st.session_state.historical_plan_result = None
+            st.error("Could not load any of the selected sets.")
+elif st.session_state.get('historical_plan_result'):
     st.header("📜 Historical game plan")
     st.markdown(st.session_state.historical_plan_result)
     st.divider()
 
 # --- AI Assistant ---
-st.header("🤖 AI Assistant")
-api_key = st.secrets.get("GEMINI_API_KEY")
-if not api_key:
-    st.error("Please add your Gemini API Key to your Streamlit secrets.")
-else:
+def _stored_ai_answer(kind, key):
+    """Latest successful coach answer of this kind if it was given for `key` (same data and model), else None."""
+    cached = st.session_state.get('ai_answers', {}).get(kind)
+    return cached[1] if cached and cached[0] == key else None
+
+def _show_ai_answer(kind, key, make_stream):
+    """Stream a coach answer, or replay the stored one when the data/model behind `key` hasn't changed.
+    Only the latest successful answer per kind is kept (in session state), so repeat clicks don't re-call Gemini."""
+    stored = _stored_ai_answer(kind, key)
+    if stored is not None:
+        st.markdown(stored)
+        return
+    answers = st.session_state.setdefault('ai_answers', {})
+    def remember(text):
+        answers[kind] = (key, text)
+    st.write_stream(make_stream(remember))
+
+@st.fragment
+def ai_assistant_panel(df_set, df_current_game, set_version):
+    """Coach buttons and answers. A fragment, so asking for advice doesn't rerun the DB/scoring/grid path.
+    Answers stay on screen until the data they were given for changes, so asking for one doesn't hide the other."""
+    st.header("🤖 AI Assistant")
+    api_key = st.secrets.get("GEMINI_API_KEY")
+    if not api_key:
+        st.error("Please add your Gemini API Key to your Streamlit secrets.")
+        return
+    model_id = st.session_state.get('selected_model_id', 'gemini-2.5-flash')
     if not st.session_state.game_over:
-        if st.button("Get AI Suggestion for Next Shot"):
-            if not df_set.empty:
+        asked = st.button("Get AI Suggestion for Next Shot")
+        if not df_set.empty:
+            balls_in_bag = st.session_state.get('balls_in_bag', [])
+            # Shots are append-only from entry, so (set, newest id, row count) identifies the data
+            key = (st.session_state.set_id, set_version, len(df_set), tuple(balls_in_bag), model_id)
+            if asked:
                 with st.spinner("🤖 Calling the coach for advice..."):
-                    suggestion = get_ai_suggestion(api_key, df_set, st.session_state.get('balls_in_bag', []), selected_model_id)
-                    st.markdown(suggestion)
-            else:
-                st.info("Submit some shots first.")
+                    _show_ai_answer('suggestion', key, lambda done: get_ai_suggestion(api_key, df_set, balls_in_bag, model_id, done))
+            elif (stored := _stored_ai_answer('suggestion', key)) is not None:
+                st.markdown(stored)
+        elif asked:
+            st.info("Submit some shots first.")
     if not df_current_game.empty:
-        if st.button("Get AI Post-Game Analysis"):
+        asked = st.button("Get AI Post-Game Analysis")
+        key = (st.session_state.game_id, set_version, len(df_current_game), model_id)
+        if asked:
             with st.spinner("🤖 Analyzing your game..."):
-                analysis = get_ai_analysis(api_key, df_current_game, selected_model_id)
-                st.markdown(analysis)
+                _show_ai_answer('analysis', key, lambda done: get_ai_analysis(api_key, df_current_game, model_id, done))
+        elif (stored := _stored_ai_answer('analysis', key)) is not None:
+            st.markdown(stored)
+
+ai_assistant_panel(df_set, df_current_game, set_version)